@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Times listing and warming (parsing every run into the run index) a plots directory with different numbers of workers.
+
+    python benchmarks/bench_crawl.py [--users N] [--runs N] [--plots N] [--workers 1 4 16] [--processes N]
+
+Synthetic runs (see synthetic.py) are written to a temporary directory, and each worker count is timed in
+its own process with an empty run index. Note that the threads mostly help when the plots are on a slow (network)
+filesystem - on a local disk, the parsing itself only gets faster with --processes.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from bench_parse import REPO_DIR
+from synthetic import write_run
+
+
+def run_child(plots_dir, workers, processes):
+    """Lists and warms the runs in this process and prints the times taken."""
+    os.chdir(os.path.dirname(os.path.dirname(plots_dir)))  # web_viewer expects to be run next to static/plots
+    sys.path.insert(0, REPO_DIR)
+    import web_viewer
+    t = time.time()
+    crawler = web_viewer.Crawler(index_path='bench_index.sqlite', workers=workers)
+    t_list = time.time() - t
+    t = time.time()
+    nruns = crawler.warm(workers, processes)
+    t_warm = time.time() - t
+    print('%3d workers  %3d processes  list %7.3f s  warm %7.2f s  (%d runs, %d errors)' %
+          (workers, processes, t_list, t_warm, nruns, len(crawler.errors)))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--runs', type=int, default=16, help='runs per user')
+    parser.add_argument('--plots', type=int, default=1024, help='plots at the most zoomed in level of each run')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--processes', type=int, default=0)
+    parser.add_argument('--child', nargs=3, help='internal: plots directory, workers and processes')
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args.child[0], int(args.child[1]), int(args.child[2]))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        plots_dir = os.path.join(tmp, 'static', 'plots')
+        for user in range(args.users):
+            for run in range(args.runs):
+                write_run(os.path.join(plots_dir, 'user%d' % user, 'run-%d' % run), args.plots, 0)
+        for workers in args.workers:
+            for name in os.listdir(tmp):
+                if name.startswith('bench_index.sqlite'):
+                    os.remove(os.path.join(tmp, name))
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--child', plots_dir,
+                                   str(workers), str(args.processes)])
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
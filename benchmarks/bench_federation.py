@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Times a viewer showing the runs of several other viewers (see remote.py), with local viewers standing in for the
+acquisition nodes.
+
+    python benchmarks/bench_federation.py [--nodes N] [--requests N] [synthetic.py options]
+
+Synthetic runs (see synthetic.py) are written for each node, along with small fake plots for the first run of
+each, and every node's viewer is started in its own process on a local port. The central viewer (in this process,
+with no runs of its own) then times:
+    crawl    fetching and merging the nodes' run lists, first from nothing and then again (when they all answer 304)
+    pages    the first Show Triggers page of each node's first run (which fetches its file names from the node),
+             then the same page --requests more times
+    plots    --requests plots proxied from each node
+and how many connections were opened to the nodes for all of that (the rest of the requests reused them).
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from bench_parse import REPO_DIR
+from bench_viewer import percentile
+from synthetic import add_run_arguments, run_options, write_tree
+
+
+def run_node(node_dir, port):
+    """Runs a node's viewer (with keep-alive connections) until it's killed."""
+    os.chdir(node_dir)
+    sys.path.insert(0, REPO_DIR)
+    from werkzeug.serving import WSGIRequestHandler
+    import web_viewer
+
+    class Handler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'  # like uwsgi --http-keepalive
+
+        def setup(self):
+            # The headers and body are written separately, so without this every kept-alive request waits for
+            # the client's delayed ACK
+            WSGIRequestHandler.setup(self)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    web_viewer.app.run(port=port, threaded=True, request_handler=Handler)
+
+
+def wait_for(port, timeout=30.0):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            socket.create_connection(('localhost', port), 1.0).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('node on port %d did not start' % port)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5100, help='port of the first node')
+    parser.add_argument('--requests', type=int, default=50, help='repeated page and plot requests per node')
+    parser.add_argument('--node', nargs=2, help='internal: run a node from a directory on a port')
+    add_run_arguments(parser)
+    args = parser.parse_args()
+    if args.node:
+        return run_node(args.node[0], int(args.node[1]))
+
+    tmp = tempfile.mkdtemp()
+    processes = []
+    try:
+        nodes = []
+        for node in range(args.nodes):
+            node_dir = os.path.join(tmp, 'node%d' % node)
+            plots_dir = os.path.join(node_dir, 'static', 'plots')
+            runs = write_tree(plots_dir, args.users, args.runs, args.files, **run_options(args))
+            for user in set(user for user, run in runs):
+                os.rename(os.path.join(plots_dir, user), os.path.join(plots_dir, 'node%d-%s' % (node, user)))
+            user, run = 'node%d-%s' % (node, runs[0][0]), runs[0][1]
+            for i in range(args.requests):
+                with open(os.path.join(node_dir, 'static', 'plots', user, run, 'tf0_zoom0_%08d.png' % i), 'wb') as f:
+                    f.write(os.urandom(32 * 1024))
+            port = args.port + node
+            processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), '--node', node_dir, str(port)],
+                                              stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT))
+            nodes.append(('http://localhost:%d' % port, user, run))
+        for node in range(args.nodes):
+            wait_for(args.port + node)
+
+        central_dir = os.path.join(tmp, 'central')
+        os.makedirs(os.path.join(central_dir, 'static', 'plots'))
+        os.chdir(central_dir)
+        sys.path.insert(0, REPO_DIR)
+        import web_viewer
+        from remote import RemoteNodes
+        remote = RemoteNodes([url for url, user, run in nodes], None, 60.0, 10.0, 4)
+        t = time.time()
+        crawler = web_viewer.Crawler(remote=remote)
+        t_crawl = time.time() - t
+        web_viewer.master_directories = crawler
+        t = time.time()
+        remote.refresh()
+        t_recrawl = time.time() - t
+        print('crawl   %d nodes, %d runs: %.3f s, again (304s) %.3f s%s' % (args.nodes, len(crawler.remote_runs), t_crawl,
+              t_recrawl, '  errors: %r' % remote.errors if remote.errors else ''))
+
+        client = web_viewer.app.test_client()
+        for url, user, run in nodes:
+            page = '/%s/%s/show_triggers/0' % (user, run)
+            t = time.time()
+            status = client.get(page).status_code
+            first = time.time() - t
+            times = []
+            for i in range(args.requests):
+                t = time.time()
+                client.get(page).get_data()
+                times.append(time.time() - t)
+            plot_times = []
+            for i in range(args.requests):
+                t = time.time()
+                response = client.get('/plots/%s/%s/tf0_zoom0_%08d.png' % (user, run, i))
+                response.get_data()
+                plot_times.append(time.time() - t)
+            pool = remote.pools[url]
+            print('%s  page %d first %.3f s, median %.4f s  plots median %.4f s p95 %.4f s  (%d requests, %d connections)' %
+                  (url, status, first, percentile(times, 0.5), percentile(plot_times, 0.5), percentile(plot_times, 0.95),
+                   pool.requests, pool.connections))
+    finally:
+        for process in processes:
+            process.kill()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compares reading a large rf_pipeline_0.json with json.loads() (the old way) and with ijson (Parser._stream_json).
+
+    python benchmarks/bench_parse.py [--plots N] [--padding BYTES]
+
+A synthetic run (see synthetic.py) with 6 transforms and 8 zoom levels is written to a temporary directory, with N plots at the 
+most zoomed in level (and half as many at each level above it). Each file entry gets BYTES of extra metadata,
+since real pipeline json files hold a lot more than the viewer needs. Each parser runs in its own process so 
+that the peak memory (max RSS) can be compared.
+"""
+
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from synthetic import write_run
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(mode, plots_dir):
+    """Parses the run in this process with the given mode and prints the time taken and max RSS."""
+    os.chdir(os.path.dirname(os.path.dirname(plots_dir)))  # web_viewer expects to be run next to static/plots
+    sys.path.insert(0, REPO_DIR)
+    import web_viewer
+    web_viewer.STREAM_PARSE_MIN_BYTES = 0 if mode == 'ijson' else None
+    t = time.time()
+    parser = web_viewer.Parser(os.path.join(plots_dir, 'bench', 'run'))
+    t = time.time() - t
+    print('%-6s  %8.2f s  %8.1f MB max RSS  (%d plots)' % (mode, t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+                                                         len(parser.table.times)))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--plots', type=int, default=65536)
+    parser.add_argument('--padding', type=int, default=200)
+    parser.add_argument('--child', nargs=2, help='internal: mode and plots directory')
+    args = parser.parse_args()
+    if args.child:
+        return run_child(*args.child)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        plots_dir = os.path.join(tmp, 'static', 'plots')
+        write_run(os.path.join(plots_dir, 'bench', 'run'), args.plots, args.padding)
+        print('rf_pipeline_0.json: %.1f MB' % (os.path.getsize(os.path.join(plots_dir, 'bench', 'run', 'rf_pipeline_0.json')) / 1024.0**2))
+        for mode in ('json', 'ijson'):
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--child', mode, plots_dir])
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
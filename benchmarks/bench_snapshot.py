@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Compares forked workers reading every run from the RunIndex with reading them from a shared snapshot (see
+snapshot.py).
+
+    python benchmarks/bench_snapshot.py [--workers N] [synthetic.py options]
+
+Synthetic runs (see synthetic.py) are written and parsed into the RunIndex (and then into a snapshot). For each
+mode, a "master" process imports the viewer (mapping the snapshot, if there is one) and forks --workers workers,
+like uwsgi does. Each worker then reads every run, and reports how long that took and how much private memory
+(Linux only - private pages from /proc/self/smaps_rollup) it took up, i.e. the memory that isn't shared with the
+other workers and so is multiplied by however many of them there are.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from bench_parse import REPO_DIR
+from synthetic import add_run_arguments, run_options, write_tree
+
+
+def private_kb():
+    """The private (clean and dirty) memory of this process, in kB."""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Private_'):
+                total += int(line.split()[1])
+    return total
+
+
+def run_master(tmp, mode, workers):
+    """Imports the viewer and forks workers that each read every run, then prints what they report."""
+    os.chdir(tmp)
+    sys.path.insert(0, REPO_DIR)
+    if mode == 'index' and os.path.exists('run_snapshot.bin'):
+        os.rename('run_snapshot.bin', 'run_snapshot.bin.off')
+    try:
+        import web_viewer
+    finally:
+        if os.path.exists('run_snapshot.bin.off'):
+            os.rename('run_snapshot.bin.off', 'run_snapshot.bin')
+    crawler = web_viewer.master_directories
+    crawler.runs.max_runs, crawler.runs.max_bytes = float('inf'), None  # keep them all, so they're all counted
+    runs = [(user, run) for user in crawler.pipeline_dir for run in crawler.pipeline_dir[user]]
+
+    pipes = []
+    for worker in range(workers):
+        read_end, write_end = os.pipe()
+        if os.fork() == 0:
+            os.close(read_end)
+            before = private_kb()
+            t = time.time()
+            plots = sum(len(crawler.get_run(user, run).table.times) for user, run in runs)
+            os.write(write_end, ('%f %d %d' % (time.time() - t, private_kb() - before, plots)).encode('ascii'))
+            os._exit(0)
+        os.close(write_end)
+        pipes.append(read_end)
+    results = []
+    for read_end in pipes:
+        results.append(os.read(read_end, 1024).decode('ascii').split())
+        os.close(read_end)
+        os.wait()
+    times = [float(t) for t, kb, plots in results]
+    kbs = [int(kb) for t, kb, plots in results]
+    print('%-8s  %d workers, %d runs, %s plots each: read in %.3f s (slowest %.3f s), %.1f MB private each (%.1f MB total)' %
+          (mode, workers, len(runs), results[0][2], sum(times) / len(times), max(times),
+           sum(kbs) / 1024.0 / len(kbs), sum(kbs) / 1024.0))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--master', nargs=2, help='internal: directory and mode')
+    add_run_arguments(parser)
+    args = parser.parse_args()
+    if args.master:
+        return run_master(args.master[0], args.master[1], args.workers)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        write_tree(os.path.join(tmp, 'static', 'plots'), args.users, args.runs, args.files, **run_options(args))
+        t = time.time()
+        subprocess.check_call([sys.executable, os.path.join(REPO_DIR, 'web_viewer.py'), '--warm', '--snapshot'],
+                              cwd=tmp)
+        print('warm + snapshot: %.1f s, snapshot %.1f MB' % (time.time() - t,
+              os.path.getsize(os.path.join(tmp, 'run_snapshot.bin')) / 1024.0**2))
+        for mode in ('index', 'snapshot'):
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--master', tmp, mode,
+                                   '--workers', str(args.workers)])
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+Benchmarks the viewer on a synthetic plots directory and writes the results to a json file.
+
+    python benchmarks/bench_viewer.py [--output results.json] [--requests N] [synthetic.py options]
+
+Three things are measured, each in its own process (so that peak memory can be compared):
+    crawl   building the Crawler() (listing every user's runs) and warming it (parsing every run into the index)
+    parse   Parser() on the biggest run, straight from its json file
+    routes  the index, runs, show_tiles, show_triggers (with and without ?all=1) and show_last_transform pages,
+            and the page comparing every run with the same prefix (in the middle of the runs), through Flask's
+            test client:
+            the first request (which parses the run), then --requests requests with the page cache cleared each
+            time, then --requests requests that are answered from the page cache
+
+Times are in seconds and memory in MB (max RSS, including the interpreter and imports). The json file also
+records the options, the Python version and the git commit, so results from different versions can be compared.
+"""
+
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from bench_parse import REPO_DIR
+from synthetic import add_run_arguments, run_options, write_tree
+
+
+def max_rss():
+    """Peak memory of this process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def bench_crawl(plots_dir, runs, args):
+    rss = max_rss()
+    t = time.time()
+    import web_viewer  # the module makes its own Crawler() when it's imported
+    t_import = time.time() - t
+    t = time.time()
+    crawler = web_viewer.Crawler(index_path='bench_crawl.sqlite')
+    t_list = time.time() - t
+    rss_list = max_rss()
+    t = time.time()
+    nruns = crawler.warm()
+    return {'list_s': t_list, 'import_s': t_import, 'warm_s': time.time() - t, 'runs': nruns,
+            'errors': len(crawler.errors), 'list_max_rss_mb': rss_list, 'warm_max_rss_mb': max_rss(),
+            'start_max_rss_mb': rss}
+
+
+def bench_parse(plots_dir, runs, args):
+    import web_viewer
+    user, run = runs[-1]
+    rss = max_rss()
+    t = time.time()
+    parser = web_viewer.Parser(os.path.join(plots_dir, user, run))
+    return {'parse_s': time.time() - t, 'plots': len(parser.table.times), 'table_mb': parser.table.nbytes / 1024.0**2,
+            'json_mb': os.path.getsize(os.path.join(plots_dir, user, run, 'rf_pipeline_0.json')) / 1024.0**2,
+            'start_max_rss_mb': rss, 'max_rss_mb': max_rss()}
+
+
+def bench_routes(plots_dir, runs, args):
+    import web_viewer
+    client = web_viewer.app.test_client()
+    user, run = runs[-1]
+    urls = [('index', '/'), ('runs', '/%s/runs' % user),
+            ('show_tiles', '/%s/%s/show_tiles/0/0/3' % (user, run)),
+            ('show_triggers', '/%s/%s/show_triggers/%d' % (user, run, args.zooms - 1)),
+            ('show_last_transform', '/%s/%s/show_last_transform/%d' % (user, run, args.zooms - 1)),
+            ('show_triggers_all', '/%s/%s/show_triggers/%d?all=1' % (user, run, args.zooms - 1)),
+            ('compare', '/%s/%s/compare/%d/%d/%d' % (user, web_viewer.run_prefix(run), args.zooms - 1, args.files // 2, args.files // 2 + 3))]
+
+    def get(url):
+        t = time.time()
+        response = client.get(url)
+        data = response.get_data()  # the pages may be streamed
+        if response.status_code != 200:
+            raise RuntimeError('%s returned %d' % (url, response.status_code))
+        return time.time() - t, len(data)
+
+    results = {}
+    for name, url in urls:
+        first, nbytes = get(url)
+        uncached = []
+        for i in range(args.requests):
+            web_viewer.page_cache._pages.clear()
+            web_viewer.page_cache.size = 0
+            uncached.append(get(url)[0])
+        cached = [get(url)[0] for i in range(args.requests)]
+        results[name] = {'url': url, 'bytes': nbytes, 'first_s': first,
+                         'uncached_median_s': percentile(uncached, 0.5), 'uncached_p95_s': percentile(uncached, 0.95),
+                         'cached_median_s': percentile(cached, 0.5), 'cached_p95_s': percentile(cached, 0.95)}
+    results['max_rss_mb'] = max_rss()
+    return results
+
+
+BENCHMARKS = {'crawl': bench_crawl, 'parse': bench_parse, 'routes': bench_routes}
+
+
+def run_child(name, plots_dir, runs, args):
+    """Runs one benchmark in this process and prints its results as json."""
+    os.chdir(os.path.dirname(os.path.dirname(plots_dir)))  # web_viewer expects to be run next to static/plots
+    sys.path.insert(0, REPO_DIR)
+    print(json.dumps(BENCHMARKS[name](plots_dir, runs, args)))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--requests', type=int, default=20, help='requests per page (uncached and cached)')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=['crawl', 'parse', 'routes'])
+    parser.add_argument('--child', nargs=2, help='internal: benchmark and plots directory')
+    add_run_arguments(parser)
+    args = parser.parse_args()
+    if args.child:
+        with open(os.path.join(os.path.dirname(os.path.dirname(args.child[1])), 'runs.json')) as f:
+            runs = [tuple(run) for run in json.load(f)]
+        return run_child(args.child[0], args.child[1], runs, args)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        plots_dir = os.path.join(tmp, 'static', 'plots')
+        t = time.time()
+        runs = write_tree(plots_dir, args.users, args.runs, args.files, **run_options(args))
+        print('Wrote %d runs in %.1f s' % (len(runs), time.time() - t))
+        with open(os.path.join(tmp, 'runs.json'), 'w') as f:
+            json.dump(runs, f)
+        options = dict((key, value) for key, value in vars(args).items() if key != 'child')
+        results = {'options': options, 'python': platform.python_version(), 'commit': git_commit(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': {}}
+        for name in args.only:
+            for path in os.listdir(tmp):
+                if path.endswith('.sqlite') or '.sqlite-' in path:
+                    os.remove(os.path.join(tmp, path))  # every benchmark starts without a run index
+            command = [sys.executable, os.path.abspath(__file__), '--child', name, plots_dir] + sys.argv[1:]
+            output = subprocess.check_output(command).decode('utf-8')
+            results['results'][name] = json.loads(output.strip().split('\n')[-1])
+            print('%-7s %s' % (name, json.dumps(results['results'][name], sort_keys=True)))
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Results written to %s' % args.output)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
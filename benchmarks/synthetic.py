@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Writes fake pipeline runs for the benchmarks, laid out like static/plots (USER/RUN/rf_pipeline_0.json).
+
+    python benchmarks/synthetic.py DIR [--users N] [--runs N] [--transforms N] [--zooms N] [--files N]
+                                       [--bonsai-groups N] [--padding BYTES]
+
+Each run has a number of plotter transforms followed by a bonsai_dedisperser, each with --zooms zoom levels.
+The most zoomed in level has --files plots, and each level above it has half as many. With --bonsai-groups,
+the bonsai_dedisperser has that many plot groups (n_plot_groups, like the multi-tree plotter), which the viewer
+shows as separate rows. --padding adds that many bytes of extra metadata to every file entry, since real json
+files hold a lot more than the viewer needs. Only the json files are written, not the plots themselves.
+"""
+
+import json
+import os
+from argparse import ArgumentParser
+
+
+def write_run(run_path, nfiles, padding=0, ntransforms=6, nzoom=8, bonsai_groups=0):
+    """Writes a synthetic rf_pipeline_0.json (the structure Parser expects) to run_path. It's written one zoom level
+    at a time, so big runs don't need much memory."""
+    os.makedirs(run_path)
+    with open(os.path.join(run_path, 'rf_pipeline_0.json'), 'w') as f:
+        f.write('{"t0": 0.0, "t1": %r, "nsamples": %d, "transforms": [' % (nfiles * 1.0, nfiles * 1024))
+        for transform in range(ntransforms):
+            bonsai = transform == ntransforms - 1
+            f.write('%s{"name": "%s", ' % (',' if transform else '', 'bonsai_dedisperser' if bonsai else 'plotter_transform'))
+            if bonsai and bonsai_groups:
+                f.write('"n_plot_groups": %d, ' % bonsai_groups)
+            f.write('"plots": [')
+            groups = [(group, zoom) for group in range(bonsai_groups) for zoom in range(nzoom)] if bonsai and bonsai_groups \
+                else [(None, zoom) for zoom in range(nzoom)]
+            for n, (group, zoom) in enumerate(groups):
+                suffix = '' if group is None else '_tree%d' % group
+                files = [{'filename': 'tf%d_zoom%d_%08d%s.png' % (transform, zoom, i, suffix), 'it0': i * 1024 << zoom,
+                          'metadata': 'x' * padding} for i in range(nfiles >> zoom)]
+                f.write('%s{"it0": 0, "files": [%s]}' % (',' if n else '', json.dumps(files)))
+            f.write(']}')
+        f.write(']}')
+
+
+def run_name(run, prefixes=4):
+    """Names runs like the pipeline does (prefix-YY-MM-DD-HH:MM:SS), spread over a few prefixes."""
+    return 'bench%d-17-10-%02d-%02d:%02d:00' % (run % prefixes, 1 + run // 1440 % 28, run // 60 % 24, run % 60)
+
+
+def write_tree(plots_dir, users, runs, nfiles, **run_options):
+    """Writes runs runs for each of users users into plots_dir. Returns [(user, run), ...]."""
+    written = []
+    for user in range(users):
+        for run in range(runs):
+            written.append(('user%d' % user, run_name(run)))
+            write_run(os.path.join(plots_dir, *written[-1]), nfiles, **run_options)
+    return written
+
+
+def add_run_arguments(parser):
+    """Adds the options for the fake runs to an ArgumentParser (shared by the benchmark scripts)."""
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=8, help='runs per user')
+    parser.add_argument('--transforms', type=int, default=6, help='transforms per run (the last is bonsai)')
+    parser.add_argument('--zooms', type=int, default=4, help='zoom levels per transform')
+    parser.add_argument('--files', type=int, default=2048, help='plots at the most zoomed in level')
+    parser.add_argument('--bonsai-groups', type=int, default=0, help='n_plot_groups for the bonsai transform')
+    parser.add_argument('--padding', type=int, default=0, help='extra bytes of metadata per file entry')
+
+
+def run_options(args):
+    return dict(padding=args.padding, ntransforms=args.transforms, nzoom=args.zooms, bonsai_groups=args.bonsai_groups)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('dir')
+    add_run_arguments(parser)
+    args = parser.parse_args()
+    written = write_tree(args.dir, args.users, args.runs, args.files, **run_options(args))
+    print('Wrote %d runs to %s' % (len(written), args.dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Lining up the plots of several runs by time, for the comparison page (see compare() in web_viewer.py).
+
+Runs with the same prefix are usually the same data run through different transform chains, so their plots
+cover the same stretches of time - but not necessarily at the same indices (one chain might start a little
+later, or drop a chunk). A RunAlignment merges the start times of the plots of every run being compared (for
+some transforms, at one zoom level) into one sorted list of time slots, and works out once which plot of each
+run covers each slot, so any window of slots can then be shown as lined up columns without any more searching.
+Start times that are within a tiny fraction of a plot of each other are the same slot, since runs of the same
+data can disagree in the last few digits.
+
+Alignments are kept in an AlignmentCache. They are keyed by the versions of the runs they were made from, so
+one whose runs have since changed is never reused (it just falls out of the cache).
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+class RunAlignment():
+    """
+    The merged time slots of some groups of plots, each a (PlotTable, transform, zoom), and which plot of each
+    group covers each slot: indices[g][slot] is the index of group g's plot, or -1 if it has none there (before
+    its first plot, after its last one or where it's missing some). Times are matched to within tolerance of the
+    shortest time between plots.
+    """
+    def __init__(self, groups, tolerance=1e-3):
+        starts = []
+        for table, transform, zoom in groups:
+            start, end = table.group(transform, zoom)
+            starts.append(table.times[start:end])
+        steps = [_step(times) for times in starts if len(times) > 1]
+        self.tolerance = tolerance * min(steps) if steps else 0.0
+
+        times = np.sort(np.concatenate(starts)) if starts else np.empty(0)
+        if len(times):
+            times = times[np.concatenate(([True], np.diff(times) > self.tolerance))]
+        self.times = times  # start time of each slot
+
+        self.indices = np.full((len(groups), len(self.times)), -1, dtype=np.int32)
+        query_times = self.times + self.tolerance  # a slot starts at the earliest of its times, so look just after
+        for g, ((table, transform, zoom), group_times) in enumerate(zip(groups, starts)):
+            if len(group_times) == 0:
+                continue
+            indices = table.find_times(transform, zoom, query_times)
+            # Each plot covers one usual step from its start, so there are gaps before the first plot, after the
+            # last one, and wherever some plots are missing
+            step = _step(group_times) if len(group_times) > 1 else self.tolerance
+            covered = (query_times >= group_times[indices]) & (query_times < group_times[indices] + step)
+            self.indices[g][covered] = indices[covered]
+
+    def find_slot(self, time):
+        """Returns the slot covering an absolute time (the first or last slot for times outside them all)."""
+        if len(self.times) == 0:
+            raise IndexError('no plots to line up')
+        slot = int(np.searchsorted(self.times, time + self.tolerance, side='right')) - 1
+        return min(max(slot, 0), len(self.times) - 1)
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.indices.nbytes
+
+    def __len__(self):
+        return len(self.times)
+
+
+class AlignmentCache():
+    """
+    Keeps the most recently used RunAlignments, dropping the least recently used ones once they take up more
+    than max_bytes.
+    """
+    def __init__(self, max_bytes=64 * 1024**2):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._alignments = OrderedDict()  # {key: RunAlignment}, least recently used first
+        self._lock = Lock()
+        self.lookups = 0  # for the /metrics page
+        self.hits = 0
+
+    def get(self, key, groups):
+        """Returns the RunAlignment for a key (which should include the versions of the runs), lining up groups
+        (see RunAlignment) if we don't have it yet."""
+        with self._lock:
+            self.lookups += 1
+            alignment = self._alignments.pop(key, None)
+            if alignment is not None:
+                self.hits += 1
+                self._alignments[key] = alignment
+                return alignment
+        alignment = RunAlignment(groups)  # outside the lock, since this can take a while for long runs
+        with self._lock:
+            old_alignment = self._alignments.pop(key, None)
+            if old_alignment is not None:
+                self.size -= old_alignment.nbytes
+            self._alignments[key] = alignment
+            self.size += alignment.nbytes
+            while len(self._alignments) > 1 and self.size > self.max_bytes:
+                old_key, old_alignment = self._alignments.popitem(last=False)
+                self.size -= old_alignment.nbytes
+        return alignment
+
+    def __len__(self):
+        return len(self._alignments)
+
+
+def _step(times):
+    # The usual time between plots in a group
+    return float(np.median(np.diff(np.sort(times))))
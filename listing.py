@@ -0,0 +1,146 @@
+"""
+Cached listings of the users and pipeline runs in the plots directory, for the index and runs pages.
+
+Listing a user's directory (and checking every run for its rf_pipeline_0.json) on every page load gets slow
+once a user has hundreds of runs on NFS. A DirectoryListing remembers what it found, along with the
+modification time of the directory, and only lists it again when that changes (a run was added, renamed or
+deleted) or the listing is more than ttl seconds old. Even then, only the new directories are checked for a
+json file. Directories without one yet (runs that are still starting up) are checked again each time.
+
+The runs are kept grouped by prefix (the run name without its timestamp) and sorted, ready for the runs page.
+
+Uses os.scandir if it's there (Python 3.5+), or the scandir backport (pip install scandir) on Python 2.
+"""
+
+from itertools import count
+from os import listdir, stat
+from os.path import isdir, isfile, join
+from threading import Lock
+from time import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class DirectoryListing():
+    """
+    Lists the users in path, and the pipeline runs of each user. A run is a directory (not starting with _)
+    that holds an rf_pipeline_0.json file.
+    """
+    def __init__(self, path, ttl=60.0):
+        self.path = path
+        self.ttl = ttl
+        self._users = None  # (mtime, time listed, [user, ...])
+        self._runs = dict()  # {user: _UserRuns}
+        self._versions = count(1)  # shared by all of the users, so a user that's forgotten and listed again
+                                   # never gets a version it had before
+        self._lock = Lock()
+        self.rescans = 0  # number of times a directory has been listed again, for the /metrics page
+
+    def users(self):
+        """Returns the user directories (in directory order)."""
+        listed = self._users
+        if listed is None or self._is_stale(self.path, listed[0], listed[1]):
+            mtime = _mtime(self.path)
+            listed = (mtime, time(), _listdirs(self.path))
+            self._users = listed
+            self.rescans += 1
+        return listed[2]
+
+    def runs(self, user):
+        """Returns (version, groups) for a user's pipeline runs, where groups is a sorted list of
+        (prefix, [run, ...]) with each group's runs sorted too. version changes whenever the runs do."""
+        user_path = join(self.path, user)
+        with self._lock:
+            user_runs = self._runs.get(user)
+            if user_runs is None:
+                user_runs = self._runs[user] = _UserRuns(self._versions)
+            if self._is_stale(user_path, user_runs.mtime, user_runs.listed):
+                user_runs.update(user_path)
+                self.rescans += 1
+                if user_runs.mtime is None:
+                    del self._runs[user]  # no such user, so don't keep it around
+            else:
+                user_runs.check_pending(user_path)
+            return user_runs.version, user_runs.groups
+
+    def _is_stale(self, dir_path, mtime, listed):
+        if listed is None or time() - listed > self.ttl:
+            return True
+        try:
+            return _mtime(dir_path) != mtime
+        except OSError:
+            return True
+
+
+class _UserRuns():
+    """What we know about one user's directory. Its versions are taken from versions (an itertools.count)."""
+    def __init__(self, versions):
+        self.mtime = None
+        self.listed = None
+        self.runs = set()  # runs with a json file
+        self.pending = set()  # directories without one (yet)
+        self.groups = []
+        self.version = 0
+        self._versions = versions
+
+    def update(self, user_path):
+        """Lists the user's directory again, checking only directories we haven't seen before for a json file."""
+        try:
+            self.mtime = _mtime(user_path)
+            names = set(name for name in _listdirs(user_path) if name[0] != '_')
+        except OSError:
+            self.mtime, names = None, set()
+        self.listed = time()
+        runs = self.runs & names
+        pending = set()
+        for name in names - self.runs:
+            if isfile(join(user_path, name, 'rf_pipeline_0.json')):
+                runs.add(name)
+            else:
+                pending.add(name)
+        self.pending = pending
+        self._set_runs(runs)
+
+    def check_pending(self, user_path):
+        """Checks whether any of the directories without a json file have one now."""
+        found = set(name for name in self.pending if isfile(join(user_path, name, 'rf_pipeline_0.json')))
+        if found:
+            self.pending = self.pending - found
+            self._set_runs(self.runs | found)
+
+    def _set_runs(self, runs):
+        if runs == self.runs and self.version:
+            return
+        self.groups = group_runs(runs)
+        self.runs = runs
+        self.version = next(self._versions)
+
+
+def group_runs(runs):
+    """Returns a sorted list of (prefix, [run, ...]) for some runs, with each prefix's runs sorted too."""
+    groups = dict()
+    for run in runs:
+        groups.setdefault(run_prefix(run), []).append(run)
+    return [(prefix, sorted(groups[prefix])) for prefix in sorted(groups)]
+
+
+def run_prefix(run):
+    """Returns a run's name without the '-YY-MM-DD-hh:mm:ss' time it was started."""
+    return run[:-18]
+
+
+def _mtime(dir_path):
+    return stat(dir_path).st_mtime
+
+
+def _listdirs(dir_path):
+    """Returns the names of the directories in dir_path."""
+    if scandir is not None:
+        return [entry.name for entry in scandir(dir_path) if entry.is_dir()]
+    return [name for name in listdir(dir_path) if isdir(join(dir_path, name))]
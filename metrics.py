@@ -0,0 +1,189 @@
+"""
+Counters, gauges and histograms for the /metrics page, in the Prometheus text format.
+
+uwsgi runs several worker processes, and a request for /metrics only reaches one of them. So every worker
+writes a snapshot of its own metrics to a small json file in a shared directory (at most every flush_interval
+seconds, when it finishes a request), and /metrics adds up the snapshots of all the workers. Counters and
+histograms from workers that have since exited are kept (so the totals don't go backwards), but their gauges
+(e.g. the runs they had in memory) are left out. The directory can be emptied whenever the viewer is restarted.
+
+Without a directory, /metrics only shows the worker that answered it.
+"""
+
+from json import dumps, loads
+from os import getpid, kill, listdir
+from os.path import join
+from threading import Lock
+from time import time
+
+from util import atomic_write
+
+
+class Metrics():
+    """
+    Holds the metrics for this process. Metrics are declared first with counter(), gauge() or histogram(),
+    then updated with inc(), set() and observe(). Collectors (functions added with add_collector()) are called
+    just before each snapshot, so that values that are cheap to read but awkward to track as they change (cache
+    sizes, hit counts, ...) can be set then.
+    """
+    def __init__(self, path=None, flush_interval=10.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._types = dict()  # {name: (type, help, buckets)}
+        self._collectors = []
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        # Workers start with nothing (they don't share what the uwsgi master had before it forked them)
+        self._values = dict()  # {name: {labels: value}}, where a histogram's value is [bucket counts..., sum, count]
+        self._pid = getpid()
+        self._started = time()
+        self._flushed = 0.0
+
+    def counter(self, name, help):
+        self._types[name] = ('counter', help, None)
+
+    def gauge(self, name, help):
+        self._types[name] = ('gauge', help, None)
+
+    def histogram(self, name, help, buckets):
+        self._types[name] = ('histogram', help, tuple(sorted(buckets)))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            values = self._get_values(name)
+            key = _labels_key(labels)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._get_values(name)[_labels_key(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            values = self._get_values(name)
+            buckets = self._types[name][2]
+            key = _labels_key(labels)
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bucket in enumerate(buckets):
+                if value <= bucket:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _get_values(self, name):
+        self._check_pid()
+        return self._values.setdefault(name, dict())
+
+    def _check_pid(self):
+        if self._pid != getpid():
+            self._reset()
+
+    def snapshot(self):
+        """Returns this process's metrics (after running the collectors)."""
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception:
+                pass  # metrics shouldn't ever break a page
+        with self._lock:
+            self._check_pid()
+            return {'pid': self._pid, 'started': self._started,
+                    'values': dict((name, dict(values)) for name, values in self._values.items())}
+
+    def maybe_flush(self):
+        """Writes this process's snapshot if it hasn't been written for flush_interval seconds."""
+        if self.path is not None and time() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes this process's snapshot to the shared directory (to a temporary file first, so /metrics never
+        reads half of one)."""
+        if self.path is None:
+            return
+        snapshot = self.snapshot()
+        file_path = join(self.path, '%d-%d.json' % (snapshot['pid'], snapshot['started']))
+        atomic_write(file_path, dumps(snapshot).encode('utf-8'))
+        self._flushed = time()
+
+    def render(self):
+        """Returns the metrics of every worker, added up, in the Prometheus text format."""
+        snapshots = [self.snapshot()]
+        if self.path is not None:
+            self.flush()
+            snapshots = self._read_snapshots()
+
+        totals = dict()  # {name: {labels: value}}
+        for snapshot in snapshots:
+            alive = _is_alive(snapshot['pid'])
+            for name, values in snapshot['values'].items():
+                if name not in self._types or (self._types[name][0] == 'gauge' and not alive):
+                    continue
+                name_totals = totals.setdefault(name, dict())
+                for key, value in values.items():
+                    if isinstance(value, list):
+                        old = name_totals.get(key, [0] * len(value))
+                        name_totals[key] = [a + b for a, b in zip(old, value)]
+                    else:
+                        name_totals[key] = name_totals.get(key, 0) + value
+
+        lines = []
+        for name in sorted(self._types):
+            kind, help, buckets = self._types[name]
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = loads(key)
+                if kind != 'histogram':
+                    lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+                    continue
+                for bucket, count in zip(buckets, value):
+                    lines.append('%s_bucket%s %d' % (name, _format_labels(labels + [['le', _format_value(bucket)]]), count))
+                lines.append('%s_bucket%s %d' % (name, _format_labels(labels + [['le', '+Inf']]), value[-1]))
+                lines.append('%s_sum%s %s' % (name, _format_labels(labels), _format_value(value[-2])))
+                lines.append('%s_count%s %d' % (name, _format_labels(labels), value[-1]))
+        return '\n'.join(lines) + '\n'
+
+    def _read_snapshots(self):
+        snapshots = []
+        for name in listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(join(self.path, name)) as f:
+                    snapshots.append(loads(f.read()))
+            except (IOError, OSError, ValueError):
+                continue  # removed (or being replaced) in the meantime
+        return snapshots
+
+
+def _labels_key(labels):
+    # Labels are stored as a json list of [name, value] pairs, so snapshots can be written out as json as they are
+    return dumps(sorted([name, '%s' % value] for name, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return '%d' % value
+
+
+def _is_alive(pid):
+    try:
+        kill(pid, 0)
+        return True
+    except OSError as e:
+        return e.errno == 1  # EPERM: it's there, it just isn't ours
@@ -0,0 +1,81 @@
+"""
+Single-image versions of the Show Tiles grid, for viewing runs over slow connections.
+
+Instead of one request per plot, the visible plots are pasted into one image (one row per transform, with
+each plot's start time written above it), and the page uses an image map so each plot can still be
+clicked. Mosaics are saved in a _mosaics directory inside the run's directory, along with their layout,
+named by a hash of the run version, zoom and indices they show. Once a run's mosaics take up more than
+max_bytes, the oldest ones are deleted.
+
+Needs Pillow (pip install Pillow).
+"""
+
+import json
+from hashlib import sha1
+from os.path import exists, join
+
+from thumbnails import evict_oldest
+from util import atomic_path, atomic_write
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+
+class MosaicCache():
+    """
+    Makes (or finds) the mosaic for a set of rows of plots. Each row is a list of (filename, label) pairs,
+    and the mosaic has a label_height pixel strip above each row for the labels and a row_gap pixel gap
+    below it.
+    """
+    def __init__(self, max_bytes=256 * 1024**2, label_height=16, row_gap=10, subdir='_mosaics'):
+        self.max_bytes = max_bytes  # per run
+        self.label_height = label_height
+        self.row_gap = row_gap
+        self.subdir = subdir
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def get(self, run_path, key, rows):
+        """Returns (path, areas) for the mosaic of rows, where areas is a list of [x0, y0, x1, y1, filename, label]
+        for each plot in it. key should identify the rows (including the version of the run), since it's used to
+        name the mosaic. Raises IOError if one of the plots can't be read."""
+        name = sha1(repr(key).encode('utf-8')).hexdigest()
+        mosaic_dir = join(run_path, self.subdir)
+        mosaic_path = join(mosaic_dir, name + '.png')
+        layout_path = join(mosaic_dir, name + '.json')
+        if exists(mosaic_path) and exists(layout_path):
+            with open(layout_path) as layout_file:
+                return mosaic_path, json.load(layout_file)
+
+        # Work out where everything goes (this only reads the image headers)
+        images, areas = [], []
+        width, height = 0, 0
+        for row in rows:
+            x, row_height = 0, 0
+            for filename, label in row:
+                image = Image.open(join(run_path, filename))
+                images.append(image)
+                areas.append([x, height + self.label_height, x + image.size[0],
+                              height + self.label_height + image.size[1], filename, label])
+                x += image.size[0]
+                row_height = max(row_height, image.size[1])
+            width = max(width, x)
+            height += self.label_height + row_height + self.row_gap
+
+        mosaic = Image.new('RGB', (max(width, 1), max(height, 1)), 'white')
+        draw = ImageDraw.Draw(mosaic)
+        for image, (x0, y0, x1, y1, filename, label) in zip(images, areas):
+            image = image.convert('RGBA')
+            mosaic.paste(image, (x0, y0), image)
+            draw.text((x0 + 2, y0 - self.label_height + 2), label, fill='black')
+
+        # The layout goes first (and both go through temporary files), so nobody finds a mosaic without one
+        atomic_write(layout_path, json.dumps(areas).encode('utf-8'))
+        with atomic_path(mosaic_path) as tmp_path:
+            mosaic.save(tmp_path, 'PNG')
+        evict_oldest(mosaic_dir, self.max_bytes)
+        return mosaic_path, areas
@@ -0,0 +1,163 @@
+"""
+Compact storage for the file names and start times of every plot in a pipeline run.
+
+Parser used to keep these as triple-nested lists ([transform][zoom][index]), which costs a Python string
+and a Python float (plus list slots) for every plot - millions of small objects per worker for long runs.
+A PlotTable keeps them in a handful of flat NumPy arrays instead:
+
+    times         float64 start time of every plot, in [transform][zoom][index] order
+    names         one utf-8 buffer with every file name, back to back
+    name_offsets  where each plot's name starts (and ends) in names
+    group_offsets where each (transform, zoom) group of plots starts (and ends) in times/name_offsets
+    zoom_offsets  where each transform's groups start (and end) in group_offsets
+
+PlotTable.fnames and PlotTable.ftimes look like the old nested lists (they can be indexed, sliced, iterated
+over and have lengths), so the viewer pages don't need to know the difference.
+
+PlotTable.find_times() finds the plots covering absolute times by bisection, for jumping straight to an event.
+
+A PlotTable can also be made straight from its arrays (see PlotTable.arrays), which are then used as they are
+rather than copied - e.g. views of a memory-mapped snapshot shared by all of the workers (see snapshot.py).
+"""
+
+import numpy as np
+
+
+class PlotTable():
+    """Builds the flat arrays from nested lists of file names and start times (see Parser._get_files()), or takes 
+    them as they are from arrays=(zoom_offsets, group_offsets, name_offsets, names, times)."""
+    def __init__(self, fnames=None, ftimes=None, arrays=None):
+        if arrays is None:
+            arrays = _build_arrays(fnames, ftimes)
+        self.zoom_offsets, self.group_offsets, self.name_offsets, self.names, self.times = arrays
+
+        self.fnames = _NestedView(self, self._get_name)
+        self.ftimes = _NestedView(self, self._get_time)
+        self._time_order = dict()  # {group: (sorted times, order)} for groups that aren't already in time order
+
+    @property
+    def arrays(self):
+        """The arrays, in the order PlotTable(arrays=...) takes them."""
+        return self.zoom_offsets, self.group_offsets, self.name_offsets, self.names, self.times
+
+    @property
+    def nbytes(self):
+        """Memory used by the arrays, in bytes."""
+        return (self.zoom_offsets.nbytes + self.group_offsets.nbytes + self.name_offsets.nbytes +
+                self.names.nbytes + self.times.nbytes)
+
+    def group(self, transform, zoom):
+        """Returns the (start, end) positions of the plots for a transform and zoom in the flat arrays."""
+        group = self.zoom_offsets[transform] + zoom
+        return int(self.group_offsets[group]), int(self.group_offsets[group + 1])
+
+    def find_times(self, transform, zoom, times):
+        """Returns the indices of the plots (for a transform and zoom) that start at or most recently before each 
+        of times, which can be a number or an array. Times before the first plot give the first plot. This is a 
+        binary search, so it's O(log n) per time."""
+        start, end = self.group(transform, zoom)
+        if start == end:
+            raise IndexError('no plots for this transform and zoom')
+        group = self.zoom_offsets[transform] + zoom
+        if group not in self._time_order:
+            group_times = self.times[start:end]
+            if np.all(group_times[1:] >= group_times[:-1]):
+                self._time_order[group] = None
+            else:
+                order = np.argsort(group_times, kind='mergesort')
+                self._time_order[group] = (group_times[order], order)
+
+        if self._time_order[group] is None:
+            sorted_times, order = self.times[start:end], None
+        else:
+            sorted_times, order = self._time_order[group]
+        indices = np.maximum(np.searchsorted(sorted_times, times, side='right') - 1, 0)
+        return indices if order is None else order[indices]
+
+    def _get_name(self, i):
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def _get_time(self, i):
+        return float(self.times[i])
+
+
+def _build_arrays(fnames, ftimes):
+    zoom_counts = [len(ftransform_group) for ftransform_group in fnames]
+    group_counts = [len(fzoom_group) for ftransform_group in fnames for fzoom_group in ftransform_group]
+    names = [name.encode('utf-8') for ftransform_group in fnames for fzoom_group in ftransform_group
+             for name in fzoom_group]
+
+    zoom_offsets = np.concatenate(([0], np.cumsum(zoom_counts, dtype=np.int64))).astype(np.int64)
+    group_offsets = np.concatenate(([0], np.cumsum(group_counts, dtype=np.int64))).astype(np.int64)
+    name_offsets = np.concatenate(([0], np.cumsum([len(name) for name in names], dtype=np.int64))).astype(np.int64)
+    names = np.frombuffer(b''.join(names), dtype=np.uint8)
+    times = np.array([time for ttransform_group in ftimes for tzoom_group in ttransform_group
+                      for time in tzoom_group], dtype=np.float64)
+    return zoom_offsets, group_offsets, name_offsets, names, times
+
+
+class _NestedView(object):
+    """Looks like fnames (or ftimes): indexing it with a transform gives the list of zoom levels."""
+    def __init__(self, table, get):
+        self._table = table
+        self._get = get
+
+    def __len__(self):
+        return len(self._table.zoom_offsets) - 1
+
+    def __getitem__(self, transform):
+        transform = _check_index(transform, len(self))
+        return _TransformView(self._table, self._get, transform)
+
+    def __iter__(self):
+        for transform in range(len(self)):
+            yield self[transform]
+
+
+class _TransformView(object):
+    """The zoom levels for one transform: indexing it with a zoom gives the list of plots."""
+    def __init__(self, table, get, transform):
+        self._table = table
+        self._get = get
+        self._transform = transform
+
+    def __len__(self):
+        return int(self._table.zoom_offsets[self._transform + 1] - self._table.zoom_offsets[self._transform])
+
+    def __getitem__(self, zoom):
+        zoom = _check_index(zoom, len(self))
+        start, end = self._table.group(self._transform, zoom)
+        return _GroupView(self._get, start, end)
+
+    def __iter__(self):
+        for zoom in range(len(self)):
+            yield self[zoom]
+
+
+class _GroupView(object):
+    """The file names (or start times) of the plots for one transform and zoom."""
+    def __init__(self, get, start, end):
+        self._get = get
+        self._start = start
+        self._end = end
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(self._start + i) for i in range(*index.indices(len(self)))]
+        return self._get(self._start + _check_index(index, len(self)))
+
+    def __iter__(self):
+        for i in range(self._start, self._end):
+            yield self._get(i)
+
+
+def _check_index(index, length):
+    """Handles negative indices and raises IndexErrors, like indexing a list would."""
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError('index out of range')
+    return index
@@ -0,0 +1,50 @@
+"""
+Runs slow jobs (like reparsing a run whose json has changed) in the background, at most once at a time each.
+
+Jobs are submitted with a key (e.g. (user, run)). If a job with the same key is already queued or running,
+nobody starts another one - the caller just gets the one that's already on its way. So however many requests
+notice that a run has changed at the same time, it only gets parsed once.
+
+Note that uwsgi only allows threads with --enable-threads.
+"""
+
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+from util import ForkSafePool
+
+
+class RefreshScheduler():
+    """
+    A small pool of threads for single-flight background jobs. submit() returns a multiprocessing AsyncResult, so
+    callers that do need the result can wait for it (for as long as they like) with .get(timeout).
+    """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pending = dict()  # {key: AsyncResult} for the jobs that haven't finished yet
+        self._lock = Lock()
+        self._pool = ForkSafePool(lambda: ThreadPool(self.workers), self._forget_pending)
+
+    def submit(self, key, job):
+        """Starts job() in the background, unless a job with the same key is already queued or running."""
+        with self._lock:
+            pool = self._pool.get()
+            result = self._pending.get(key)
+            if result is None:
+                result = self._pending[key] = pool.apply_async(self._run, (key, job))
+            return result
+
+    def is_pending(self, key):
+        with self._lock:
+            self._pool.get()
+            return key in self._pending
+
+    def _forget_pending(self):
+        self._pending = dict()  # the master's, which aren't running in this process
+
+    def _run(self, key, job):
+        try:
+            return job()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
@@ -0,0 +1,253 @@
+"""
+Pipeline runs from other machines, so that one viewer can show the plots from several acquisition nodes.
+
+Every node runs its own viewer, which lists its runs at /api/runs (the modification time and size of each
+run's rf_pipeline_0.json, see runs_api() in web_viewer.py), and serves each run's file names and times at
+/api/<user>/<run>/meta and the plots themselves at /plots/... and /thumbnails/... . The central viewer fetches
+the run lists of all of the nodes at once (a thread each) and merges them into its Crawler. A run's file names
+are only fetched from its node the first time it's viewed, and are kept in the RunIndex afterwards like any
+other run. The run lists are fetched again every ttl seconds, with the ETag of the last one, so a node whose
+runs haven't changed just answers 304.
+
+Requests to each node go over a small pool of keep-alive connections (per process, since connections don't
+survive uwsgi forking its workers), so the nodes' uwsgi should be run with --http-keepalive. The last run list
+from each node is saved in cache_path, so the runs of a node that's down are still listed when the viewer
+restarts (and their pages still work if their file names are in the RunIndex - only the plots themselves will
+be missing).
+"""
+
+from json import dumps, loads
+from multiprocessing.pool import ThreadPool
+from os.path import exists
+from socket import error as socket_error
+from threading import Lock
+from time import time
+from zlib import decompress, MAX_WBITS
+
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib import quote
+    from urlparse import urlsplit
+except ImportError:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import quote, urlsplit
+
+from util import ForkSafePool, atomic_write
+
+
+class RemoteError(IOError):
+    """A node couldn't be reached, or didn't answer the way it should have."""
+    pass
+
+
+class ConnectionPool():
+    """
+    Keep-alive HTTP connections to one node. A connection is taken from the pool for each request and put back
+    once its response has been read to the end, so up to size connections stay open for the next requests.
+    """
+    def __init__(self, url, size=4, timeout=10.0):
+        parts = urlsplit(url)
+        self.connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')  # if the node's viewer isn't at the root of its server
+        self.size = size
+        self.timeout = timeout
+        self.requests = 0  # requests sent, and connections opened for them, for the /metrics page
+        self.connections = 0
+        self._idle = ForkSafePool(list)  # the master's connections mustn't be shared by its workers
+        self._lock = Lock()
+
+    def request(self, path, headers=None):
+        """Sends a GET request for path (quoted, and without the node's prefix). Returns the response, which has to
+        be read to the end and then given back with release() (or closed, if it isn't going to be read)."""
+        for attempt in range(2):
+            connection, reused = self._get_connection()
+            try:
+                connection.request('GET', self.prefix + path, headers=headers or {})
+                response = connection.getresponse()
+            except (HTTPException, socket_error) as e:
+                connection.close()
+                if reused and attempt == 0:
+                    continue  # the node closed the connection while it was idle, so try a new one
+                raise RemoteError('%s:%s: %r' % (self.host, self.port, e))
+            self.requests += 1
+            response.pool_connection = connection
+            return response
+
+    def release(self, response):
+        """Puts a response's connection back in the pool (once the response has been read)."""
+        connection = response.pool_connection
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        with self._lock:
+            idle = self._idle.get()
+            if len(idle) < self.size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def get(self, path, headers=None):
+        """Sends a GET request and reads the whole response. Returns (status, headers, body)."""
+        response = self.request(path, headers)
+        try:
+            body = response.read()
+        except (HTTPException, socket_error) as e:
+            response.pool_connection.close()
+            raise RemoteError('%s:%s: %r' % (self.host, self.port, e))
+        self.release(response)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = decompress(body, MAX_WBITS | 16)
+        return response.status, dict((name.lower(), value) for name, value in response.getheaders()), body
+
+    def _get_connection(self):
+        # Returns (connection, whether it has been used before)
+        with self._lock:
+            idle = self._idle.get()
+            if idle:
+                return idle.pop(), True
+        self.connections += 1
+        return self.connection_class(self.host, self.port, timeout=self.timeout), False
+
+
+class RemoteNodes():
+    """
+    The run lists of the other nodes, and connections to them. nodes is a list of the base urls of their viewers
+    (e.g. 'http://frb2:5000'). If two nodes have a run with the same user and name, the first one's is used.
+    """
+    def __init__(self, nodes, cache_path=None, ttl=60.0, timeout=10.0, connections=4):
+        self.nodes = [node.rstrip('/') for node in nodes]
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.pools = dict((node, ConnectionPool(node, connections, timeout)) for node in self.nodes)
+        self.runs = dict()  # {node: {user: {run: [mtime, size]}}}, from the last run lists we got
+        self.errors = dict()  # {node: error} for the nodes that couldn't be reached last time
+        self.version = 0  # changes whenever the runs do
+        self.fetched = None  # when the run lists were last fetched
+        self._etags = dict()  # {node: ETag of its last run list}
+        if cache_path is not None and exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.runs = dict((node, runs) for node, runs in loads(f.read()).items() if node in self.pools)
+            except (IOError, OSError, ValueError):
+                pass  # start without it
+
+    def is_stale(self):
+        return self.fetched is None or time() - self.fetched > self.ttl
+
+    def refresh(self):
+        """Fetches the run lists of all of the nodes at the same time, keeping the last one we had for any node that
+        can't be reached. Returns True if any of them changed."""
+        self.fetched = time()
+        pool = ThreadPool(max(len(self.nodes), 1))
+        try:
+            fetched = pool.map(self._fetch_runs, self.nodes)
+        finally:
+            pool.close()
+        runs = dict(self.runs)
+        for node, node_runs in zip(self.nodes, fetched):
+            if node_runs is not None:
+                runs[node] = node_runs
+        if runs == self.runs:
+            return False
+        self.runs = runs
+        self.version += 1
+        self._save()
+        return True
+
+    def _fetch_runs(self, node):
+        # Returns a node's runs, or None if they haven't changed (or the node can't be reached)
+        headers = {'Accept-Encoding': 'gzip'}
+        if node in self._etags and node in self.runs:
+            headers['If-None-Match'] = self._etags[node]
+        try:
+            status, response_headers, body = self.pools[node].get('/api/runs', headers)
+            if status == 304:
+                self.errors.pop(node, None)
+                return None
+            if status != 200:
+                raise RemoteError('%s/api/runs returned %d' % (node, status))
+            runs = loads(body)['runs']
+        except (RemoteError, ValueError, KeyError) as e:
+            self.errors[node] = repr(e)
+            return None
+        self.errors.pop(node, None)
+        if 'etag' in response_headers:
+            self._etags[node] = response_headers['etag']
+        return runs
+
+    def _save(self):
+        # Written to a temporary file first, since the workers all share the cache
+        if self.cache_path is None:
+            return
+        try:
+            atomic_write(self.cache_path, dumps(self.runs).encode('utf-8'))
+        except (IOError, OSError):
+            pass  # we'll just have to fetch them all again next time
+
+    def merged(self):
+        """Returns {(user, run): (node, (mtime, size))} for the runs on all of the nodes."""
+        merged = dict()
+        for node in reversed(self.nodes):  # so the first node's runs win
+            for user, user_runs in self.runs.get(node, {}).items():
+                for run, version in user_runs.items():
+                    merged[(user, run)] = (node, tuple(version))
+        return merged
+
+    def read_files(self, node, user, run):
+        """Fetches a run's (fnames, ftimes) from its node (see Parser._get_files() for their layout)."""
+        status, headers, body = self.pools[node].get('/api/%s/%s/meta' % (_quote(user), _quote(run)),
+                                                     {'Accept-Encoding': 'gzip'})
+        if status == 404:
+            return None, None  # the node can't show it either
+        if status != 200:
+            raise RemoteError('%s: meta for %s/%s returned %d' % (node, user, run, status))
+        meta = loads(body)
+        return meta['fnames'], meta['ftimes']
+
+    def node_path(self, node, url):
+        """Returns the path (and query) of a url on a node's viewer, without the node's prefix. The viewer here has
+        the same pages for the node's runs, so that's where a browser that can't reach the node should go."""
+        parts = urlsplit(url)
+        path = parts.path
+        prefix = self.pools[node].prefix
+        if prefix and (path + '/').startswith(prefix + '/'):
+            path = path[len(prefix):] or '/'
+        return path + ('?' + parts.query if parts.query else '')
+
+    def open(self, node, path, headers=None):
+        """Starts a GET request for path on a node, for passing the response on to the browser. Returns
+        (response, body), where body is an iterator over the response that puts its connection back in the
+        pool once it has all been read."""
+        pool = self.pools[node]
+        response = pool.request(path, headers)
+
+        def body():
+            done = False
+            try:
+                while True:
+                    chunk = response.read(64 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+                done = True
+            except (HTTPException, socket_error):
+                pass
+            finally:
+                if done:
+                    pool.release(response)
+                else:
+                    response.pool_connection.close()  # the browser went away (or the node did) part way through
+        return response, body()
+
+
+def quote_path(*segments):
+    """Quotes the segments of a path on a node (user, run, file name, ...) and joins them with slashes."""
+    return '/' + '/'.join(_quote(segment) for segment in segments)
+
+
+def _quote(segment):
+    if not isinstance(segment, bytes):
+        segment = segment.encode('utf-8')
+    return quote(segment, safe='/:')
@@ -0,0 +1,190 @@
+"""
+On-disk index of parsed pipeline runs, shared by all of the uwsgi worker processes.
+
+Each run's file names and start times (exactly what Parser() pulls out of rf_pipeline_0.json) are stored
+in a SQLite database the first time any worker asks for the run, keyed by user/run and the modification
+time and size of the json file. Every other worker (and every restart of the viewer) then reads the
+run back from the index instead of parsing the json again. The database is in WAL mode, so readers
+never wait for the worker that is writing a new run. A worker parsing a run claims it with a lock file of its
+own (in a directory next to the database), so that other workers asking for the same run wait for it rather
+than parsing it too, while runs that nobody else is parsing go ahead at the same time. The database itself is
+only locked for the moment it takes to write each run.
+
+The index can be deleted at any time - it will just be rebuilt as runs are viewed.
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from fcntl import flock, LOCK_EX, LOCK_UN
+from hashlib import sha1
+from os import getpid, makedirs
+from os.path import join
+from threading import local
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    run TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    ntransforms INTEGER,    -- NULL if the run had no plots
+    max_zoom INTEGER,
+    UNIQUE (user, run)
+);
+CREATE TABLE IF NOT EXISTS zooms (
+    run_id INTEGER NOT NULL,
+    transform INTEGER NOT NULL,
+    zoom INTEGER NOT NULL,
+    max_index INTEGER NOT NULL,
+    PRIMARY KEY (run_id, transform, zoom)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS plots (
+    run_id INTEGER NOT NULL,
+    transform INTEGER NOT NULL,
+    zoom INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (run_id, transform, zoom, idx)
+) WITHOUT ROWID;
+"""
+
+
+class RunIndex():
+    """
+    Stores and loads (fnames, ftimes) for pipeline runs (see Parser._get_files() for their layout).
+    Connections are opened per thread and per process, so an index made before uwsgi forks is still
+    safe to use in the workers.
+    """
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.timeout = timeout  # how long to wait for another worker that is writing to the index
+        self.lock_dir = path + '-locks'  # a lock file for each run, see _claim()
+        self._local = local()
+
+    def _connect(self):
+        """Returns this thread's connection to the database, opening it (and the tables) if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for attempt in range(10):
+                try:
+                    conn.executescript(SCHEMA)
+                    break
+                except sqlite3.OperationalError as e:
+                    # Another thread or worker made the tables in the meantime (Python 2's sqlite3 doesn't retry)
+                    if 'schema has changed' not in str(e) or attempt == 9:
+                        raise
+            self._local.conn = conn
+            self._local.pid = getpid()
+        return conn
+
+    def _get_run_row(self, conn, user, run, mtime, size):
+        """Returns (id, ntransforms) for a run if the index holds an up to date copy of it, or None."""
+        row = conn.execute('SELECT id, mtime, size, ntransforms FROM runs WHERE user = ? AND run = ?',
+                           (user, run)).fetchone()
+        if row is None or (row[1], row[2]) != (mtime, size):
+            return None
+        return row[0], row[3]
+
+    def load(self, user, run, mtime, size):
+        """Returns (fnames, ftimes) for a run, or None if it isn't in the index or the json has changed since it
+        was added. Note that (None, None) is a valid result, for runs without any plots."""
+        conn = self._connect()
+        row = self._get_run_row(conn, user, run, mtime, size)
+        if row is None:
+            return None
+        run_id, ntransforms = row
+        if ntransforms is None:
+            return None, None
+
+        # Build the nested lists with the right shape first (some zoom levels may be empty), then fill them in
+        fnames = [[] for transform in range(ntransforms)]
+        ftimes = [[] for transform in range(ntransforms)]
+        for transform, zoom, max_index in conn.execute('SELECT transform, zoom, max_index FROM zooms WHERE run_id = ? '
+                                                       'ORDER BY transform, zoom', (run_id,)):
+            fnames[transform].append([])
+            ftimes[transform].append([])
+        for transform, zoom, filename, time in conn.execute('SELECT transform, zoom, filename, time FROM plots '
+                                                            'WHERE run_id = ? ORDER BY transform, zoom, idx', (run_id,)):
+            fnames[transform][zoom].append(filename)
+            ftimes[transform][zoom].append(time)
+        return fnames, ftimes
+
+    def load_or_store(self, user, run, mtime, size, parse, exclusive=True):
+        """Returns (fnames, ftimes) for a run from the index. If it isn't there, parse() is called to get them and
+        the result is stored. Only one worker parses a given run - the others wait for it and then read it back
+        (workers parsing other runs aren't held up). With exclusive=False, the run isn't claimed, so that several 
+        runs can be parsed at once without waiting for anybody (e.g. by Crawler.warm()) - the same run may then 
+        occasionally be parsed twice."""
+        files = self.load(user, run, mtime, size)
+        if files is not None:
+            return files
+        if not exclusive:
+            fnames, ftimes = parse()
+            self._store_new(user, run, mtime, size, fnames, ftimes)
+            return fnames, ftimes
+
+        with self._claim(user, run):
+            files = self.load(user, run, mtime, size)  # whoever had the claim before us may have just stored it
+            if files is not None:
+                return files
+            fnames, ftimes = parse()
+            self._store_new(user, run, mtime, size, fnames, ftimes)
+        return fnames, ftimes
+
+    @contextmanager
+    def _claim(self, user, run):
+        """Holds an exclusive lock on a run's lock file (waiting for whoever has it now). The lock goes with the 
+        file descriptor, so it's let go of even if the worker holding it dies."""
+        try:
+            makedirs(self.lock_dir)
+        except OSError:
+            pass  # it's already there
+        key = u'%s/%s' % (user, run)
+        with open(join(self.lock_dir, sha1(key.encode('utf-8')).hexdigest()), 'a') as f:
+            flock(f.fileno(), LOCK_EX)
+            try:
+                yield
+            finally:
+                flock(f.fileno(), LOCK_UN)
+
+    def _store_new(self, user, run, mtime, size, fnames, ftimes):
+        """Stores a run in one short transaction, unless somebody else has stored the same version already."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._get_run_row(conn, user, run, mtime, size) is None:
+                self._store(conn, user, run, mtime, size, fnames, ftimes)
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _store(self, conn, user, run, mtime, size, fnames, ftimes):
+        """Replaces whatever the index has for a run with new file names and times (in an open transaction)."""
+        row = conn.execute('SELECT id FROM runs WHERE user = ? AND run = ?', (user, run)).fetchone()
+        if row is not None:
+            conn.execute('DELETE FROM zooms WHERE run_id = ?', (row[0],))
+            conn.execute('DELETE FROM plots WHERE run_id = ?', (row[0],))
+            conn.execute('DELETE FROM runs WHERE id = ?', (row[0],))
+
+        if fnames is None:
+            conn.execute('INSERT INTO runs (user, run, mtime, size) VALUES (?, ?, ?, ?)', (user, run, mtime, size))
+            return
+        max_zoom = max(len(transform) for transform in fnames) if fnames else 0
+        run_id = conn.execute('INSERT INTO runs (user, run, mtime, size, ntransforms, max_zoom) VALUES (?, ?, ?, ?, ?, ?)',
+                              (user, run, mtime, size, len(fnames), max_zoom)).lastrowid
+        conn.executemany('INSERT INTO zooms VALUES (?, ?, ?, ?)',
+                         ((run_id, transform, zoom, len(fzoom_group))
+                          for transform, ftransform_group in enumerate(fnames)
+                          for zoom, fzoom_group in enumerate(ftransform_group)))
+        conn.executemany('INSERT INTO plots VALUES (?, ?, ?, ?, ?, ?)',
+                         ((run_id, transform, zoom, index, name, ftimes[transform][zoom][index])
+                          for transform, ftransform_group in enumerate(fnames)
+                          for zoom, fzoom_group in enumerate(ftransform_group)
+                          for index, name in enumerate(fzoom_group)))
@@ -0,0 +1,97 @@
+"""
+A read-only snapshot of every run's parsed file names and times, memory-mapped and shared by all of the workers.
+
+Even with the RunIndex, each uwsgi worker reads every run it shows out of SQLite into its own PlotTable, so the
+same runs end up in memory once per worker, and each worker has to read them again after it starts. A snapshot
+holds the PlotTable arrays (see plot_table.py) of all of the runs in one file:
+
+    magic         8 bytes, 'WVSNAP01'
+    header size   8 bytes, little-endian
+    header        json: {"runs": [[user, run, mtime, size, [[offset, length], ...]], ...]}, where each run has
+                  the offset and length of each of its arrays (in PlotTable.arrays order), padded to 8 bytes
+    arrays        the arrays themselves, each starting on an 8 byte boundary (offsets are from the first one)
+
+The file is mapped with mmap, and the PlotTables for its runs are made from views of the mapping, so nothing is
+copied: every worker (and the uwsgi master, which loads it before forking) reads the same pages of the page cache,
+and only the pages that are actually looked at are read from disk. Each run is kept with the modification time
+and size of its rf_pipeline_0.json, so a run that has changed since the snapshot was written is simply read the
+usual way instead.
+
+The snapshot is written to a temporary file and renamed into place, so it can be rewritten while the viewer is
+running - workers carry on using the one they mapped until they are restarted.
+"""
+
+import mmap
+from json import dumps, loads
+from os import remove
+from struct import pack, unpack
+
+import numpy as np
+
+from plot_table import PlotTable
+from util import atomic_path
+
+MAGIC = b'WVSNAP01'
+DTYPES = (np.int64, np.int64, np.int64, np.uint8, np.float64)  # of the arrays, in PlotTable.arrays order
+
+
+class RunSnapshot():
+    """
+    Maps a snapshot file. get() returns the PlotTable for a run, if the snapshot has an up to date copy of it.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:8] != MAGIC:
+            raise ValueError('%s is not a run snapshot' % path)
+        header_size = unpack('<Q', self._map[8:16])[0]
+        self._start = 16 + header_size + (-header_size % 8)
+        self._runs = dict()  # {(user, run): ((mtime, size), [(offset, length), ...])}
+        for user, run, mtime, size, arrays in loads(self._map[16:16 + header_size].decode('utf-8'))['runs']:
+            self._runs[(user, run)] = ((mtime, size), arrays)
+
+    def get(self, user, run, version):
+        """Returns a PlotTable for a run (viewing the mapped file), or None if the snapshot doesn't have the run or
+        the (mtime, size) of its json has changed since."""
+        entry = self._runs.get((user, run))
+        if entry is None or entry[0] != version:
+            return None
+        return PlotTable(arrays=[np.frombuffer(self._map, dtype, length // np.dtype(dtype).itemsize, self._start + offset)
+                                 for dtype, (offset, length) in zip(DTYPES, entry[1])])
+
+    @property
+    def nbytes(self):
+        return len(self._map)
+
+    def __len__(self):
+        return len(self._runs)
+
+
+def write_snapshot(path, runs):
+    """Writes a snapshot of runs, an iterable of (user, run, (mtime, size), PlotTable) that is only gone through
+    once (so the runs don't all have to be in memory at the same time). Returns the number of runs written."""
+    header = []
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path + '.data', 'wb') as data:
+            for user, run, version, table in runs:
+                arrays = []
+                for dtype, array in zip(DTYPES, table.arrays):
+                    array = np.ascontiguousarray(array, dtype=dtype)
+                    arrays.append([data.tell(), array.nbytes])
+                    data.write(array.tobytes())
+                    data.write(b'\0' * (-array.nbytes % 8))
+                header.append([user, run, version[0], version[1], arrays])
+
+        # The arrays were written to a file of their own, since the header has to go first
+        encoded = dumps({'runs': header}).encode('utf-8')
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + pack('<Q', len(encoded)) + encoded + b'\0' * (-len(encoded) % 8))
+            with open(tmp_path + '.data', 'rb') as data:
+                while True:
+                    chunk = data.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        remove(tmp_path + '.data')
+    return len(header)
@@ -0,0 +1,91 @@
+"""
+Tests for the viewer showing runs from another machine (see remote.py), with a small fake node standing in for
+the other machine's viewer.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from flask import Flask, jsonify, redirect
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER, RUN = 'alice', 'test-run-17-10-18-12:00:00'
+PLOT = b'\x89PNG not really a plot'
+
+
+def make_node():
+    """A node with one run, whose thumbnails are never ready (so it redirects to the full plot, like a real
+    viewer does while a thumbnail is being made)."""
+    node = Flask('node')
+
+    @node.route('/api/runs')
+    def runs():
+        return jsonify(runs={USER: {RUN: [1508328000.0, 1234]}})
+
+    @node.route('/thumbnails/<user>/<run>/<path:filename>')
+    def thumbnail(user, run, filename):
+        return redirect('/plots/%s/%s/%s' % (user, run, filename))  # made absolute, with the node's host
+
+    @node.route('/plots/<user>/<run>/<path:filename>')
+    def plot(user, run, filename):
+        return PLOT, 200, {'Content-Type': 'image/png'}
+
+    return node
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class ProxiedRedirectTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server('localhost', 0, make_node(), threaded=True, request_handler=QuietHandler)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.node_url = 'http://localhost:%d' % cls.server.server_port
+
+        cls.cwd = os.getcwd()
+        cls.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.tmp, 'static', 'plots'))
+        os.chdir(cls.tmp)  # the viewer keeps its index and caches in the current directory
+        sys.path.insert(0, REPO_DIR)
+        import web_viewer
+        from remote import RemoteNodes
+        cls.web_viewer = web_viewer
+        cls.saved = web_viewer.master_directories, web_viewer.REMOTE_PLOT_MODE
+        web_viewer.master_directories = web_viewer.Crawler(index_path=None,
+                                                           remote=RemoteNodes([cls.node_url], None, 60.0, 5.0))
+        web_viewer.REMOTE_PLOT_MODE = 'proxy'
+        cls.client = web_viewer.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.web_viewer.master_directories, cls.web_viewer.REMOTE_PLOT_MODE = cls.saved
+        cls.server.shutdown()
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.tmp)
+
+    def test_redirect_points_here(self):
+        response = self.client.get('/thumbnails/%s/%s/tf0_z0_3.png' % (USER, RUN))
+        self.assertEqual(response.status_code, 302)
+        location = response.headers['Location']
+        self.assertTrue(location.endswith('/plots/%s/%s/tf0_z0_3.png' % (USER, RUN)), location)
+        self.assertNotIn(self.node_url, location)
+
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), PLOT)
+
+
+if __name__ == '__main__':
+    unittest.main()
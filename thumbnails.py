@@ -0,0 +1,128 @@
+"""
+Small versions of the plots, for the Show Triggers and Show Last Transform overview pages.
+
+Thumbnails are made the first time they are asked for, by a small pool of worker threads (Pillow does the
+decoding and resizing without holding the GIL), and saved in a _thumbnails directory inside the run's
+directory. Nothing waits for them - the plot itself is sent until its thumbnail is ready. Their file names
+are a hash of the plot's path, size and modification time and the thumbnail settings, so a changed plot (or
+different settings) simply gets a new thumbnail. Once a run's thumbnails take up more than max_bytes, the oldest
+ones are deleted (this is checked after every max_bytes / 16 of new thumbnails, like in variants.py).
+
+Needs Pillow (pip install Pillow), with WebP support for WebP thumbnails.
+"""
+
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+from os import listdir, remove, stat
+from os.path import basename, dirname, exists, getsize, join
+from threading import Lock
+
+from util import ForkSafePool, atomic_path
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+
+class ThumbnailCache():
+    """
+    Returns the path of a thumbnail (at most width pixels wide) for a plot, if it has been made, and starts making
+    it otherwise. Thumbnails are PNGs, or WebPs if asked for and Pillow can write them. A thumbnail that is asked
+    for again while it's being made isn't made twice (by this process).
+    """
+    def __init__(self, width=300, max_bytes=64 * 1024**2, workers=4, subdir='_thumbnails'):
+        self.width = width
+        self.max_bytes = max_bytes  # per run
+        self.workers = workers
+        self.subdir = subdir
+        self.webp = Image is not None and features.check('webp')
+        self._pool = ForkSafePool(lambda: ThreadPool(self.workers), self._forget_pending)
+        self._pending = dict()  # {thumbnail path: AsyncResult} for the thumbnails being made
+        self._lock = Lock()
+        self._written = dict()  # {thumbnail directory: bytes of thumbnails made since it was last trimmed}
+        self.hits = 0  # thumbnails that were already there, for the /metrics page
+        self.misses = 0
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def get(self, plot_path, fmt='png'):
+        """Returns the path of the thumbnail for the plot at plot_path in the format fmt ('png' or 'webp'). If the
+        thumbnail hasn't been made yet, this starts making it in the background and returns None straight away, so
+        the caller can send the plot itself this time. Raises IOError (or OSError) if the plot doesn't exist or the
+        last attempt at making the thumbnail failed."""
+        if fmt == 'webp' and not self.webp:
+            fmt = 'png'
+        plot_stat = stat(plot_path)
+        key = '%s:%s:%s:%d:%s' % (basename(plot_path), plot_stat.st_mtime, plot_stat.st_size, self.width, fmt)
+        thumb_path = join(dirname(plot_path), self.subdir, '%s.%s' % (sha1(key.encode('utf-8')).hexdigest(), fmt))
+        if exists(thumb_path):
+            self.hits += 1
+            return thumb_path
+
+        self.misses += 1
+        with self._lock:
+            result = self._pending.get(thumb_path)
+            if result is not None and result.ready():
+                # It failed (the callback drops the ones that worked), so say so, and try again next time
+                del self._pending[thumb_path]
+                result.get()
+            if result is None:
+                self._pending[thumb_path] = self._pool.get().apply_async(
+                    make_thumbnail, (plot_path, thumb_path, self.width, fmt),
+                    callback=lambda size: self._made(thumb_path, size))
+        return None
+
+    def _made(self, thumb_path, size):
+        # Called (by the pool) once a thumbnail has been made. Every so often the run's thumbnails are trimmed, in
+        # a pool thread since that means listing the whole directory.
+        thumb_dir = dirname(thumb_path)
+        with self._lock:
+            self._pending.pop(thumb_path, None)
+            self._written[thumb_dir] = self._written.get(thumb_dir, 0) + size
+            if self._written[thumb_dir] < self.max_bytes // 16:
+                return
+            self._written[thumb_dir] = 0
+        self._pool.get().apply_async(evict_oldest, (thumb_dir, self.max_bytes))
+
+    def _forget_pending(self):
+        self._pending = dict()  # the master's, which aren't being made in this process
+
+
+def make_thumbnail(plot_path, thumb_path, width, fmt='png'):
+    """Makes one thumbnail, at most width pixels wide, and returns its size. It's written to a temporary file first,
+    so other processes never see half of one."""
+    if exists(thumb_path):
+        return 0  # somebody else asked for it first
+    image = Image.open(plot_path)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    image.thumbnail((width, image.size[1]), Image.ANTIALIAS)
+    with atomic_path(thumb_path) as tmp_path:
+        if fmt == 'webp':
+            image.save(tmp_path, 'WEBP', quality=80)
+        else:
+            image.save(tmp_path, 'PNG', optimize=True)
+    return getsize(thumb_path)
+
+
+def evict_oldest(cache_dir, max_bytes):
+    """Deletes the oldest files in a cache directory until they take up at most max_bytes."""
+    files = []
+    for name in listdir(cache_dir):
+        try:
+            file_stat = stat(join(cache_dir, name))
+        except OSError:
+            continue
+        files.append((file_stat.st_mtime, file_stat.st_size, name))
+    size = sum(f[1] for f in files)
+    for mtime, file_size, name in sorted(files):
+        if size <= max_bytes:
+            break
+        try:
+            remove(join(cache_dir, name))
+        except OSError:
+            pass
+        size -= file_size
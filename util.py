@@ -0,0 +1,65 @@
+"""
+Small helpers shared by the viewer and its caches.
+
+uwsgi imports the viewer once and then forks its workers, so anything that can't be shared between processes -
+like a pool of threads or processes - has to be made again in each worker (see ForkSafePool). And the workers all
+write to the same files, so files are written to a temporary name first and then renamed into place, which means
+nobody ever reads half of one (see atomic_write() and atomic_path()).
+"""
+
+from contextlib import contextmanager
+from os import getpid, makedirs, remove, rename
+from os.path import dirname, exists
+from threading import current_thread
+
+
+class ForkSafePool():
+    """
+    A pool (or anything else that mustn't be shared with forked processes), made with make_pool() the first time
+    it's needed in each process. Pools don't survive uwsgi forking its workers, so each process makes its own.
+    If on_new is given, it's called whenever a process makes its pool, e.g. to forget the jobs that were pending
+    in the master.
+    """
+    def __init__(self, make_pool, on_new=None):
+        self.make_pool = make_pool
+        self.on_new = on_new
+        self._pool = None
+        self._pid = None
+
+    def get(self):
+        """Returns this process's pool."""
+        if self._pool is None or self._pid != getpid():
+            self._pool = self.make_pool()
+            self._pid = getpid()
+            if self.on_new is not None:
+                self.on_new()
+        return self._pool
+
+
+def atomic_write(path, data):
+    """Writes data (bytes) to path, through a temporary file (see atomic_path())."""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+
+@contextmanager
+def atomic_path(path):
+    """Gives the block a temporary path (in the same directory, making it if needed) to write path's new contents
+    to, for writers that want a file name of their own (like Pillow's Image.save()). It's renamed to path once the
+    block is done, or deleted if the block fails."""
+    if not exists(dirname(path) or '.'):
+        try:
+            makedirs(dirname(path))
+        except OSError:
+            pass  # made by another process in the meantime
+    tmp_path = '%s.%d.%s.tmp' % (path, getpid(), current_thread().ident)
+    try:
+        yield tmp_path
+    except BaseException:
+        try:
+            remove(tmp_path)
+        except OSError:
+            pass  # never got as far as writing it
+        raise
+    rename(tmp_path, path)
@@ -0,0 +1,121 @@
+"""
+Smaller versions of the plots, for sending to browsers that are a long way away.
+
+The plotter writes big lossless PNGs, which are mostly flat colours and text, so they lose very little as a WebP
+(or as a PNG with a 256 colour palette, for browsers without WebP) and are a fraction of the size. A variant is
+a plot in one of those formats, at some quality and (optionally) scaled down to at most some width. Variants are
+made in the background the first time they are asked for, by a small pool of processes (nothing waits for them -
+the plot itself is sent until its variant is ready, so a few big plots being transcoded never hold up the threads
+answering requests), and saved in one cache directory shared by all of the runs and workers. Their file names
+are a hash of the plot's path, size and modification time and the variant's settings, so a changed plot simply
+gets new variants. Reading a variant touches its modification time, and once the cache
+takes up more than max_bytes, the least recently used variants are deleted (see thumbnails.evict_oldest()).
+
+Needs Pillow (pip install Pillow), with WebP support for WebP variants.
+"""
+
+from hashlib import sha1
+from multiprocessing import Pool
+from os import stat, utime
+from os.path import abspath, exists, getsize, join
+from threading import Lock
+
+from thumbnails import evict_oldest
+from util import ForkSafePool, atomic_path
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+FORMATS = ('webp', 'png')
+
+
+class VariantCache():
+    """
+    Returns the path of a variant of a plot, if it has been made, and starts making it otherwise. Up to processes
+    variants are made at the same time. A variant that is asked for again while it's being made isn't made twice
+    (by this process).
+    """
+    def __init__(self, cache_dir='_variants', max_bytes=1024**3, processes=2):
+        self.cache_dir = abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.processes = processes
+        self.webp = Image is not None and features.check('webp')
+        self._pool = ForkSafePool(lambda: Pool(self.processes), self._forget_pending)
+        self._pending = dict()  # {variant path: AsyncResult} for the variants being made
+        self._lock = Lock()
+        self._written = 0  # bytes of variants made since the cache was last trimmed
+        self.hits = 0  # variants that were already there, for the /metrics page
+        self.misses = 0
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def get(self, plot_path, fmt='webp', quality=80, width=None):
+        """Returns the path of a variant of the plot at plot_path in the format fmt ('webp' or 'png'), at quality
+        (1-100, for WebPs - 100 makes a lossless one) and at most width pixels wide (or the plot's own width).
+        If the variant hasn't been made yet, this starts making it in the background and returns None straight
+        away, so the caller can send the plot itself this time. Raises IOError (or OSError) if the plot doesn't
+        exist or the last attempt at making the variant failed."""
+        if fmt == 'webp' and not self.webp:
+            fmt = 'png'
+        if fmt == 'png':
+            quality = 100  # palette PNGs don't have a quality, so they're all the same variant
+        plot_stat = stat(plot_path)
+        key = '%s:%s:%s:%s:%d:%s' % (abspath(plot_path), plot_stat.st_mtime, plot_stat.st_size, fmt, quality, width)
+        variant_path = join(self.cache_dir, '%s.%s' % (sha1(key.encode('utf-8')).hexdigest(), fmt))
+        if exists(variant_path):
+            self.hits += 1
+            try:
+                utime(variant_path, None)  # so it's kept over the ones that haven't been used lately
+            except OSError:
+                pass  # evicted in the meantime - it was still there a moment ago
+            return variant_path
+
+        self.misses += 1
+        with self._lock:
+            result = self._pending.get(variant_path)
+            if result is not None and result.ready():
+                # It failed (the callback drops the ones that worked), so say so, and try again next time
+                del self._pending[variant_path]
+                result.get()
+            if result is None:
+                self._pending[variant_path] = self._pool.get().apply_async(
+                    make_variant, (plot_path, variant_path, fmt, quality, width),
+                    callback=lambda size: self._made(variant_path, size))
+        return None
+
+    def _made(self, variant_path, size):
+        # Called (by the pool) once a variant has been made. Every so often the cache is trimmed, in a pool process
+        # since that means listing the whole cache directory.
+        with self._lock:
+            self._pending.pop(variant_path, None)
+            self._written += size
+            if self._written < self.max_bytes // 16:
+                return
+            self._written = 0
+        self._pool.get().apply_async(evict_oldest, (self.cache_dir, self.max_bytes))
+
+    def _forget_pending(self):
+        self._pending = dict()  # the master's, which aren't being made in this process
+
+
+def make_variant(plot_path, variant_path, fmt, quality, width):
+    """Makes one variant (in a pool process) and returns its size. It's written to a temporary file first, so
+    other processes never see half of one. This is a plain function so that it can be sent to the pool."""
+    if exists(variant_path):
+        return 0  # somebody else asked for it first
+    image = Image.open(plot_path)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    if width is not None and width < image.size[0]:
+        image.thumbnail((width, image.size[1]), Image.ANTIALIAS)
+    with atomic_path(variant_path) as tmp_path:
+        if fmt == 'webp':
+            image.save(tmp_path, 'WEBP', quality=quality, lossless=quality >= 100)
+        else:
+            image = image.convert('RGBA').quantize(256, method=Image.FASTOCTREE)
+            image.save(tmp_path, 'PNG', optimize=True)
+    return getsize(variant_path)
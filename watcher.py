@@ -0,0 +1,134 @@
+"""
+Background watcher that keeps a Crawler's listing of pipeline runs up to date, so the viewer pages
+never have to rescan a user's directory while someone is waiting for them.
+
+If pyinotify is installed (pip install pyinotify), the plots directory, each user directory and each
+run directory are watched with inotify, and a run is (re)loaded as soon as its rf_pipeline_0.json is
+written. Otherwise (or if inotify isn't available, e.g. on some network filesystems), the directories
+are polled every poll_interval seconds instead. Either way, only the run that changed is parsed.
+
+Note that uwsgi only allows threads with --enable-threads.
+"""
+
+from os import listdir, stat
+from os.path import abspath, isdir, join, relpath
+from threading import Thread
+from time import sleep
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+class RunWatcher(Thread):
+    """
+    Calls crawler.add_run() for every new or rewritten rf_pipeline_0.json and crawler.remove_run() for
+    every run directory that disappears.
+    """
+    def __init__(self, crawler, poll_interval=30.0, use_inotify=True):
+        Thread.__init__(self, name='RunWatcher')
+        self.daemon = True
+        self.crawler = crawler
+        self.path = crawler.path
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and pyinotify is not None
+        self._known = dict()  # {(user, run): (mtime, size)} of the json files we've seen, for polling
+
+    def run(self):
+        if self.use_inotify:
+            try:
+                self._watch()
+                return
+            except Exception:
+                pass  # fall back to polling (e.g. we ran out of inotify watches)
+        self._poll()
+
+    def _update_run(self, user, run):
+        """Tells the crawler about a new or changed run. Errors (e.g. a half written json) are ignored here -
+        the run will be tried again the next time it changes, or when somebody asks for it."""
+        try:
+            self.crawler.add_run(user, run)
+        except Exception:
+            pass
+
+    def _poll(self):
+        """Checks the modification time of every run's json file every poll_interval seconds."""
+        first_pass = True
+        while True:
+            seen = set()
+            for user in self._listdirs(self.path):
+                for run in self._listdirs(join(self.path, user)):
+                    if run[0] == '_':
+                        continue
+                    try:
+                        json_stat = stat(join(self.path, user, run, 'rf_pipeline_0.json'))
+                    except OSError:
+                        continue
+                    key = (user, run)
+                    seen.add(key)
+                    if self._known.get(key) != (json_stat.st_mtime, json_stat.st_size):
+                        self._known[key] = (json_stat.st_mtime, json_stat.st_size)
+                        # The crawler already listed the runs that were there when it started, and will parse
+                        # them when they're first viewed, so there's no need to parse them all right now
+                        if not first_pass or run not in self.crawler.pipeline_dir.get(user, {}):
+                            self._update_run(user, run)
+            for user, run in set(self._known) - seen:
+                del self._known[(user, run)]
+                self.crawler.remove_run(user, run)
+            first_pass = False
+            sleep(self.poll_interval)
+
+    def _listdirs(self, path):
+        try:
+            return [name for name in listdir(path) if isdir(join(path, name))]
+        except OSError:
+            return []
+
+    def _watch(self):
+        """Watches the plots directory (for new users), the user directories (for new runs) and the run
+        directories (for their json files) with inotify. This only returns if something goes wrong."""
+        watch_manager = pyinotify.WatchManager()
+        dir_mask = pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM
+        file_mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+        watcher = self
+        root = abspath(self.path)  # pyinotify reports absolute paths
+
+        def add_watch(path, mask):
+            wdd = watch_manager.add_watch(path, mask, quiet=False)
+            if wdd.get(path, -1) < 0:
+                raise OSError('Could not watch %s' % path)
+
+        def watch_run(user, run, new=False):
+            if run[0] == '_':
+                return
+            add_watch(join(self.path, user, run), file_mask)
+            # For new directories, the json may have been written before we started watching (e.g. the run
+            # was moved here, or was made along with a new user directory)
+            if new and isdir(join(self.path, user, run)) and 'rf_pipeline_0.json' in listdir(join(self.path, user, run)):
+                self._update_run(user, run)
+
+        def watch_user(user, new=False):
+            add_watch(join(self.path, user), dir_mask)
+            for run in self._listdirs(join(self.path, user)):
+                watch_run(user, run, new)
+
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                # Work out whether this happened in the plots, user or run directory
+                parts = relpath(event.pathname, root).split('/')
+                created = event.mask & (pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO)
+                if len(parts) == 1 and event.dir and created:
+                    watch_user(parts[0], new=True)
+                elif len(parts) == 2 and event.dir and created:
+                    watch_run(parts[0], parts[1], new=True)
+                elif len(parts) == 2 and event.dir:
+                    watcher.crawler.remove_run(*parts)
+                elif len(parts) == 3 and parts[2] == 'rf_pipeline_0.json':
+                    watcher._update_run(parts[0], parts[1])
+
+        notifier = pyinotify.Notifier(watch_manager, Handler())
+        add_watch(self.path, dir_mask)
+        for user in self._listdirs(self.path):
+            watch_user(user)
+        notifier.loop()
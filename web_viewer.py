@@ -1,15 +1,51 @@
 #!/usr/bin/env python
-from os import walk
-from os.path import isfile, exists
-from json import loads
+from os import walk, stat, getpid, remove
+from os.path import isfile, getsize, abspath, exists, join
+from json import loads, dumps
+from decimal import Decimal
+from array import array
+from datetime import datetime, timedelta
+from functools import wraps
+from timeit import default_timer
+from hashlib import md5
+from re import search
+from zlib import compressobj, decompress, DEFLATED, MAX_WBITS
 from math import ceil
-from flask import Flask, url_for
+from collections import OrderedDict
+from threading import Lock
+from flask import Flask, url_for, request, make_response, send_file, send_from_directory, safe_join, abort, redirect, jsonify
+from flask import Response, stream_with_context, g
+from markupsafe import Markup
+from werkzeug.urls import url_quote
+from plot_table import PlotTable
+from run_index import RunIndex
+from watcher import RunWatcher
+from thumbnails import ThumbnailCache, make_thumbnail
+from variants import VariantCache, FORMATS as VARIANT_FORMATS
+from mosaics import MosaicCache
+from listing import DirectoryListing, group_runs, run_prefix
+from metrics import Metrics
+from refresh import RefreshScheduler
+from remote import RemoteNodes, RemoteError, quote_path
+from snapshot import RunSnapshot, write_snapshot
+from compare import AlignmentCache
+from util import atomic_write
+from multiprocessing import Pool, TimeoutError
+from multiprocessing.pool import ThreadPool
+
+try:
+    import ijson.backends.yajl2_c as ijson  # much faster, if ijson was built with it
+except ImportError:
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
 app = Flask(__name__)
 
 
 """
 This is web viewer for the L1 pipeline. Currently, it retrieves files from the /data2/web_viewer directory, 
-but it can be easily modified to get files from multiple machines. Running the web viewer will display
+and from the viewers on any other machines listed in REMOTE_NODES. Running the web viewer will display
 a list of users, each with a list of pipeline runs in their directories.
 
 A persistent web viewer is running from the frb1 web_viewer account, and is up at frb1.physics.mcgill.ca:5000/!
@@ -20,6 +56,11 @@ A persistent web viewer is running from the frb1 web_viewer account, and is up a
 
 DEPENDENCIES
 Flask (pip install Flask)
+NumPy (pip install numpy)
+ijson (pip install ijson, optional - for reading very large rf_pipeline_0.json files without loading them into memory)
+scandir (pip install scandir, optional - for listing the users and runs faster on Python 2)
+Pillow (pip install Pillow, optional - for the thumbnails on the Show Triggers and Show Last Transform pages,
+        and the mosaic view of Show Tiles)
 
 SETUP
 In your web_viewer directory, 
@@ -28,7 +69,70 @@ In your web_viewer directory,
     ln -s /data2/web_viewer plots
 
 RUNNING
-    uwsgi --socket 0.0.0.0:5000 --plugin python --protocol=http -w wsgi --callable app
+    uwsgi --socket 0.0.0.0:5000 --plugin python --protocol=http -w wsgi --callable app --enable-threads
+
+Plots are served by the plot() page rather than Flask's static folder, so that browsers can cache them for good
+(they never change once the pipeline has written them). The Show Tiles page and the Fast Viewer show smaller 
+versions of them instead (WebPs, or palette PNGs for browsers without WebP, see variant() and variants.py), 
+which are made by VARIANT_PROCESSES processes in each worker and kept in VARIANT_CACHE_DIR - the full plot is
+still a click away. If the viewer is behind nginx (or apache/lighttpd), 
+PLOT_SENDFILE_MODE can be set so that the web server sends the plot files itself. For nginx, that needs 
+something like
+    location /_plots/ { internal; alias /data2/web_viewer/; }
+
+Runs are only parsed when one of their pages is first requested (pages wait for at most RUN_LOAD_TIMEOUT 
+seconds - after that they ask the browser to try again shortly), and each worker keeps at most 
+RUN_CACHE_MAX_RUNS parsed runs (or roughly RUN_CACHE_MAX_BYTES of them) in memory. Change these below
+if the viewer is running on a machine with more or less memory to spare. Parsed runs are also saved in 
+a SQLite index (RUN_INDEX_PATH, see run_index.py) that all of the uwsgi workers share, so each run's json 
+only gets parsed once. New and updated runs are picked up in the background by a RunWatcher (watcher.py), 
+which needs uwsgi's --enable-threads option. When a run that's already in memory has changed, its pages 
+carry on using what we had while it is reparsed in the background (see refresh.py). 
+
+With many workers, each of them still ends up with its own copy of every run it has shown. Running
+    python web_viewer.py --snapshot [--workers N] [--processes N]
+writes the file names and times of every local run to SNAPSHOT_PATH (see snapshot.py), which is mapped into
+memory when the viewer starts - i.e. by the uwsgi master, before it forks the workers. Runs that haven't changed
+since are then read straight out of the mapping, which all of the workers share, so adding workers doesn't add 
+to the memory they use (or to the time each of them takes to get going). Run it again (e.g. from cron) and 
+restart the viewer to pick up new runs - in the meantime they are parsed as usual.
+
+The run directories are listed by CRAWL_WORKERS threads at startup, since on NFS most of that time is spent 
+waiting for the file server. To parse every run into the index before the viewer starts (so that nobody has 
+to wait for a big run to be parsed the first time it is viewed), run
+    python web_viewer.py --warm [--workers N] [--processes N]
+
+Runs that have finished don't change any more, so their pages can be exported to static HTML and sent by 
+the web server itself, without going through uwsgi at all:
+    python web_viewer.py --export USER [RUN ...] [--workers N] [--processes N] [--force]
+writes every Show Tiles window that can be reached from the runs and overview pages, and every Show Triggers 
+and Show Last Transform page (with all of their plots) of the runs (all of the user's runs if none are given) 
+to an EXPORT_DIR directory inside each run, and the user's runs page to one inside the user's directory (see 
+export_runs()). The exported pages show the plot files themselves (and thumbnails exported with them) from 
+/static/plots. Runs that haven't changed since they were last exported are skipped, so this can be run from 
+cron. With nginx (and the viewer at @viewer), something like
+    location /static/plots/ { alias /data2/web_viewer/; }
+    location ~ ^/([^/]+)/runs$ { 
+        root /data2/web_viewer; try_files /$1/_pages/runs$is_args.html @viewer; }
+    location ~ ^/([^/]+)/([^/]+)/(show_tiles/\d+/\d+/\d+|show_triggers/\d+|show_last_transform/\d+)$ { 
+        root /data2/web_viewer; try_files /$1/$2/_pages/$3$is_args.html @viewer; }
+sends the exported pages and their images, and passes everything else (including pages with a ?query, and runs 
+that haven't been exported) on to the viewer. Note that the exported runs page only changes when the export is 
+run again. 
+
+To show the runs from several machines in one place, run a viewer on each of them and list their urls in 
+REMOTE_NODES on the one people look at. Their runs are listed alongside the local ones (a local run wins if 
+both have one with the same name), and their plots are either proxied (REMOTE_PLOT_MODE = 'proxy', if 
+browsers can't reach the other machines) or redirected to. Mosaics and exports are only made for local runs. 
+See remote.py. 
+
+Runs with the same prefix (the same data through different transform chains) can be compared side by side at 
+.../USER/PREFIX/compare/ZOOM/INDEX1/INDEX2, with their plots lined up by time rather than by index (see 
+compare() and compare.py). 
+
+Request latencies and sizes, parse times, cache hit rates and the runs held in memory are shown (in the 
+Prometheus text format) at /metrics, added up over all of the uwsgi workers (see metrics.py). Requests 
+slower than SLOW_REQUEST_SECONDS can also be logged, with the user, run, zoom and plots they were for.
 
 
 *Slightly annoying note: the zoom levels in the url are opposite those in the filenames, hence the 
@@ -38,38 +142,104 @@ RUNNING
 """
 
 
+RUN_CACHE_MAX_RUNS = 64               # maximum number of parsed runs kept in memory by each worker
+RUN_CACHE_MAX_BYTES = 256 * 1024**2   # rough cap on the memory used by those runs (None for no cap)
+RUN_INDEX_PATH = 'run_index.sqlite'   # index of parsed runs shared between workers (None to always parse the json)
+WATCH_POLL_INTERVAL = 30.0            # seconds between directory scans if inotify (pyinotify) isn't available
+STREAM_PARSE_MIN_BYTES = 16 * 1024**2 # json files at least this big are streamed with ijson, if it's installed
+PAGE_CACHE_MAX_BYTES = 32 * 1024**2   # memory each worker may use for rendered show_tiles/show_triggers/... pages
+PLOT_MAX_AGE = 365 * 24 * 3600        # how long browsers may cache plots from runs with timestamped names (seconds)
+PLOT_SENDFILE_MODE = None             # None (uwsgi sends plots), 'x-sendfile' (apache/lighttpd) or 'x-accel-redirect' (nginx)
+PLOT_ACCEL_REDIRECT_PREFIX = '/_plots/'  # internal nginx location pointing at static/plots, for 'x-accel-redirect'
+THUMBNAIL_WIDTH = 300                 # width (in pixels) of the plots on the Show Triggers/Show Last Transform pages
+THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024**2  # disk space the thumbnails for each run may take up
+THUMBNAIL_WORKERS = 4                 # threads making thumbnails in each worker
+MOSAIC_CACHE_MAX_BYTES = 256 * 1024**2  # disk space the Show Tiles mosaics for each run may take up
+VARIANT_CACHE_DIR = '_variants'       # where the WebP/palette PNG versions of the plots are kept (see variants.py)
+VARIANT_CACHE_MAX_BYTES = 1024**3     # disk space they may take up, for all of the runs
+VARIANT_PROCESSES = 2                 # processes in each worker making them
+VARIANT_QUALITY = 80                  # WebP quality of the plots on the Show Tiles page and the Fast Viewer (100 for lossless)
+OVERVIEW_PAGE_PLOTS = 50              # plots sent with the Show Triggers/Show Last Transform pages (and per later request)
+API_MAX_PLOTS = 500                   # most plots the plots api will return at once
+AT_COLUMNS = 4                        # plots across the Show Tiles page that the time lookup jumps to
+COMPARE_COLUMNS = 4                   # time slots across the page comparing runs
+ALIGNMENT_CACHE_MAX_BYTES = 64 * 1024**2  # memory each worker may use for the time alignments of the compared runs
+CRAWL_WORKERS = 8                     # threads listing (and warming) runs at startup - mostly waiting on the filesystem
+CRAWL_PROCESSES = 0                   # processes parsing json files for Crawler.warm() (0 to parse in the crawl threads)
+LISTING_TTL = 60.0                    # seconds the users/runs pages may go without relisting a directory that hasn't changed
+TEMPLATE_STREAM_BUFFER = 250          # pieces of a page (a few per plot) rendered before they're sent to the browser
+METRICS_DIR = 'metrics'               # where the workers leave their metrics for /metrics to add up (None for just one worker)
+METRICS_FLUSH_INTERVAL = 10.0         # seconds between each worker's metrics snapshots
+SLOW_REQUEST_SECONDS = None           # log requests that take longer than this (None not to)
+REFRESH_WORKERS = 2                   # threads in each worker reparsing runs in the background
+RUN_LOAD_TIMEOUT = 10.0               # seconds a page waits for a run it has never seen to be parsed
+EXPORT_DIR = '_pages'                 # directory in each run (and user) directory that exported pages are written to
+REMOTE_NODES = []                     # urls of the viewers on other machines whose runs are shown here too (see remote.py)
+REMOTE_PLOT_MODE = 'proxy'            # 'proxy' (their plots are sent through this viewer) or 'redirect' (browsers get them)
+REMOTE_INDEX_TTL = 60.0               # seconds between fetches of the other machines' run lists
+REMOTE_TIMEOUT = 10.0                 # seconds to wait for another machine to answer
+REMOTE_CONNECTIONS = 4                # keep-alive connections each worker keeps open to each of them
+REMOTE_CACHE_PATH = 'remote_runs.json'  # last run lists from the other machines (None not to keep them)
+SNAPSHOT_PATH = 'run_snapshot.bin'    # parsed runs memory-mapped by all of the workers, if it exists (see snapshot.py)
+
+
 class Parser():
     """
     This gets the list of file names at different zoom levels produced by the plotter transforms, and reads 
     all information relevant to displaying the required images (min/max index and zoom values and timestamps)
-    for an individual pipeline run. This is repeatedly called by the Crawler() class as it discovers new 
-    users and pipeline run directories. 
+    for an individual pipeline run. This is called by the RunCache() class the first time a run is 
+    requested (and again whenever its rf_pipeline_0.json changes). If the file names and timestamps have
+    already been read from the RunIndex, they can be passed in as files=(fnames, ftimes) instead. 
+    The file names and timestamps are stored in a PlotTable (see plot_table.py) - fnames and ftimes can be
+    used just like the nested lists from _get_files(), but take up a lot less memory. A PlotTable that 
+    already exists (e.g. from the RunSnapshot) can be passed in as table instead.
     """
-    def __init__(self, path):
+    def __init__(self, path, files=None, table=None):
         # First, read everything in /data2/web_viewer, and extract file names and timestamps
-        self.fnames, self.ftimes = self._get_files(path) 
+        if table is None and files is None:
+            files = self._get_files(path) 
+        if table is not None:
+            self.table = table
+            self.fnames, self.ftimes = self.table.fnames, self.table.ftimes
+        elif files[0] is not None:
+            self.table = PlotTable(*files)
+            self.fnames, self.ftimes = self.table.fnames, self.table.ftimes
+        else:
+            self.table = None
+            self.fnames, self.ftimes = None, None
+        self.size = self._get_size()
+        self.version = None  # (mtime, size) of the json file this was read from, set by the RunCache
 
         # Calculate some useful values for the viewer, given a successful run
         if self.fnames is not None and self._check_zoom():
             self.min_zoom, self.min_index = 0, 0
             self.max_zoom = len(self.fnames[0])
             self.max_index = [[len(zoom) for zoom in transform] for transform in self.fnames]
+            self.zoom_max_index = [max(element[zoom] for element in self.max_index) for zoom in range(self.max_zoom)]
 
         # In case a directory does not contain plots or transforms contain a different number of zoom levels
         else:
             self.min_zoom, self.min_index = None, None
             self.max_zoom = None
             self.max_index = None
+            self.zoom_max_index = None
         
-    def _get_files(self, path):
+    @staticmethod
+    def _get_files(path):
         """Outputs a list of plot filenames and plot start times as a tuple based on the .json file produced from 
         pipeline runs. The output is in the following form:
         [[[z0tf0f0, z0tf0f1, ...], [z1tf0f0, z1tf0f1, ...], ..., [...]],
          [[z0tf1f0, z0tf1f0, ...], [z1tf1f0, z1tf1f1, ...], ..., [...]],
          [...]]
+        Large json files are read with _stream_json() so that we only ever hold on to the parts we need. 
         """
-        json_file = open(path + '/rf_pipeline_0.json').read()
-        json_data = loads(json_file)
+        start = default_timer()
+        json_path = path + '/rf_pipeline_0.json'
+        if ijson is not None and STREAM_PARSE_MIN_BYTES is not None and getsize(json_path) >= STREAM_PARSE_MIN_BYTES:
+            json_data = Parser._stream_json(json_path)
+        else:
+            json_file = open(json_path).read()
+            json_data = loads(json_file)
         transforms_list = json_data['transforms']
         fnames = []  # stores file names (so the viewer can request them)
         ftimes = []  # stores timestamps (to be displayed for chime_stream_from_times())
@@ -147,10 +317,59 @@ class Parser():
 
         # Check whether there was anything of value in the run
         if len(fnames) != 0:
+            metrics.observe('web_viewer_parse_seconds', default_timer() - start)
             return fnames, ftimes
         else:
             return None, None
 
+    @staticmethod
+    def _stream_json(json_path):
+        """Reads rf_pipeline_0.json one event at a time (with ijson), keeping only what _get_files() uses. The output
+        looks like json.loads() would give, except that each transform only has its name, n_plot_groups and plots, 
+        each plot only has its it0 and files[0], and each file only has its filename and it0 (see _StreamedFiles). 
+        This means the memory used depends on the number of plots, not on the size of the json file."""
+        json_data = {'transforms': []}
+        files_index = -1
+        with open(json_path, 'rb') as json_file:
+            for prefix, event, value in ijson.parse(json_file):
+                # The file entries make up nearly all of the json, so we check for those first
+                if event == 'map_key':
+                    continue
+                elif prefix == 'transforms.item.plots.item.files.item.item.filename':
+                    if files_index == 0:
+                        zoom_level['files'][0].filenames.append(value)
+                elif prefix == 'transforms.item.plots.item.files.item.item.it0':
+                    if files_index == 0:
+                        zoom_level['files'][0].it0s.append(value)
+                elif prefix.startswith('transforms.item.plots.item.files.item.item'):
+                    continue
+
+                elif prefix in ('t0', 't1', 'nsamples'):
+                    json_data[prefix] = float(value) if isinstance(value, Decimal) else value  # to match json.loads()
+                elif prefix == 'transforms.item' and event == 'start_map':
+                    transform = dict()
+                    json_data['transforms'].append(transform)
+                elif prefix in ('transforms.item.name', 'transforms.item.n_plot_groups'):
+                    transform[prefix[16:]] = value
+                elif prefix == 'transforms.item.plots' and event == 'start_array':
+                    transform['plots'] = []
+                elif prefix == 'transforms.item.plots.item' and event == 'start_map':
+                    zoom_level = {'files': [_StreamedFiles()]}
+                    files_index = -1
+                    transform['plots'].append(zoom_level)
+                elif prefix == 'transforms.item.plots.item.it0':
+                    zoom_level['it0'] = value
+                elif prefix == 'transforms.item.plots.item.files.item' and event == 'start_array':
+                    files_index += 1  # we only want files[0]
+        return json_data
+
+    def _get_size(self):
+        """Memory (in bytes) held by the file names and timestamps. This is used so the RunCache can decide 
+        when to throw away old runs."""
+        if self.table is None:
+            return 0
+        return self.table.nbytes
+
     def _check_zoom(self):
         """Back in the dark days without ch_frb_rfi, you could force the bonsai plotter and the transform plotter
         to produce a different number of zoom levels! This doesn't make sense, so the web_viewer won't display
@@ -182,38 +401,348 @@ class Parser():
         return s
 
 
+class _StreamedFiles():
+    """
+    Stands in for the files[0] list of a plot group in Parser._stream_json(). Rather than a dictionary for every 
+    file, this just keeps a list of file names and an array of it0s, and hands out the dictionaries one at a 
+    time when _get_files() loops over it. 
+    """
+    def __init__(self):
+        self.filenames = []
+        self.it0s = array('l')
+
+    def __iter__(self):
+        for name, it0 in zip(self.filenames, self.it0s):
+            yield {'filename': name, 'it0': it0}
+
+
+class RunNotReady(Exception):
+    """Raised by RunCache.get() when a run still hasn't been parsed after RUN_LOAD_TIMEOUT seconds."""
+    pass
+
+
+class RunCache():
+    """
+    Keeps the Parser() objects for the most recently viewed pipeline runs. Runs are parsed the first time 
+    they are asked for, and reparsed if the size or modification time of their rf_pipeline_0.json has changed 
+    since (i.e. the run was still going when it was first viewed). Once there are more than max_runs runs, or 
+    they take up more than roughly max_bytes, the least recently used ones are thrown away. If there is a 
+    RunIndex, runs are read from there instead of from their json files whenever possible. 
+    With a RefreshScheduler, runs are parsed in the background, and only once however many pages ask for them 
+    at the same time. A run that has changed is returned as it was until the new version is ready, and a run 
+    we don't have at all is waited for for up to load_timeout seconds.
+    With a RunSnapshot (see snapshot.py), runs that haven't changed since it was written are read straight 
+    from it, without parsing or the RunIndex. Their file names and times are shared with the other workers,
+    so they don't count towards max_bytes.
+    """
+    def __init__(self, max_runs=RUN_CACHE_MAX_RUNS, max_bytes=RUN_CACHE_MAX_BYTES, index=None, refresher=None,
+                 load_timeout=RUN_LOAD_TIMEOUT, snapshot=None):
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.index = index
+        self.refresher = refresher
+        self.load_timeout = load_timeout
+        self.snapshot = snapshot
+        self.size = 0
+        self._runs = OrderedDict()  # {(user, run): (mtime, size, Parser)}, least recently used first
+        self._lock = Lock()
+        self.lookups = 0  # checked lookups, and how many of them were already cached, for the /metrics page
+        self.hits = 0
+        self.snapshot_hits = 0  # lookups that weren't cached, but were in the snapshot
+
+    def get(self, user, run, run_path, validate=True, read_files=None, version=None, background=False):
+        """Returns the Parser for a run, parsing it if it isn't cached or has changed. If validate is False, a 
+        cached Parser is returned without checking the json file (used for repeated lookups in one request).
+        read_files(run_path) can be given to read (fnames, ftimes) from the json some other way (e.g. in another 
+        process, or from another machine) - the RunIndex isn't locked while it runs, so several runs can be read 
+        at once. It's called straight away, unless background is True, when it goes through the RefreshScheduler 
+        like any other page's run. For runs on other machines, the (mtime, size) of their json is given as 
+        version instead."""
+        key = (user, run)
+        with self._lock:
+            entry = self._runs.get(key)
+            if entry is not None and not validate:
+                self._runs[key] = self._runs.pop(key)
+                return entry[2]
+        if version is None:
+            json_stat = stat(run_path + '/rf_pipeline_0.json')
+            version = (json_stat.st_mtime, json_stat.st_size)
+        self.lookups += 1
+        if entry is not None and (entry[0], entry[1]) == version:
+            self.hits += 1
+            with self._lock:
+                if key in self._runs:
+                    self._runs[key] = self._runs.pop(key)
+            return entry[2]
+        if self.snapshot is not None:
+            table = self.snapshot.get(user, run, version)
+            if table is not None:
+                self.snapshot_hits += 1
+                parser = Parser(run_path, table=table)
+                parser.size = 0  # the snapshot's pages, not this worker's
+                return self._add(key, version, parser)
+        if self.refresher is None or (read_files is not None and not background):
+            return self._load(user, run, run_path, version, read_files)
+
+        result = self.refresher.submit(key, lambda: self._load(user, run, run_path, version, read_files))
+        if entry is not None:
+            metrics.inc('web_viewer_stale_runs_served_total')
+            return entry[2]  # the old version will do until the new one is ready
+        try:
+            return result.get(self.load_timeout)
+        except TimeoutError:
+            raise RunNotReady('%s/%s is still being loaded' % (user, run))
+
+    def _load(self, user, run, run_path, version, read_files=None):
+        """Parses a run (or reads it from the index) and adds it to the cache."""
+        key = (user, run)
+        if self.index is None:
+            parser = Parser(run_path, read_files(run_path) if read_files is not None else None)
+        elif read_files is not None:
+            files = self.index.load_or_store(user, run, version[0], version[1], lambda: read_files(run_path),
+                                             exclusive=False)
+            parser = Parser(run_path, files)
+        else:
+            def parse():
+                parser = Parser(run_path)
+                return parser.fnames, parser.ftimes
+            files = self.index.load_or_store(user, run, version[0], version[1], parse)
+            parser = Parser(run_path, files)
+        return self._add(key, version, parser)
+
+    def _add(self, key, version, parser):
+        """Adds a Parser to the cache (replacing any older version of its run)."""
+        parser.version = version
+        with self._lock:
+            old_entry = self._runs.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[2].size
+            self._runs[key] = (version[0], version[1], parser)
+            self.size += parser.size
+            self._evict()
+        return parser
+
+    def _evict(self):
+        """Drops least recently used runs until we're back under both caps (always keeping the newest one)."""
+        while len(self._runs) > 1 and (len(self._runs) > self.max_runs or
+                                       (self.max_bytes is not None and self.size > self.max_bytes)):
+            key, entry = self._runs.popitem(last=False)
+            self.size -= entry[2].size
+
+    @property
+    def plots(self):
+        """The number of plots in all of the cached runs."""
+        with self._lock:
+            return sum(len(entry[2].table.times) for entry in self._runs.values() if entry[2].table is not None)
+
+    def __len__(self):
+        return len(self._runs)
+
+
 class Crawler():
     """
-    Searches the two top directories pointed to by plots (assumed to be users -> pipeline runs). 
-    Parser() is called for each pipeline run, creating a dictionary with information about 
-    each pipeline run for each user. 
+    Searches the two top directories pointed to by plots (assumed to be users -> pipeline runs) and keeps
+    a listing of each user's pipeline runs. Nothing is parsed here - the Parser() for a run is made by
+    the RunCache (from the shared RunIndex if possible) the first time get_run() is called for it, or by warm(). 
+    With RemoteNodes (see remote.py), the runs on the other machines are added to pipeline_dir too, with the 
+    url of their plots as their path. With a RunSnapshot, unchanged runs are read from there (see RunCache).
     Separate class here because I thought it might be nice for it to get other interesting metadata
     at some point. Could just be added to Parser if not. 
     """
-    def __init__(self, path='static/plots'):
+    def __init__(self, path='static/plots', max_runs=RUN_CACHE_MAX_RUNS, max_bytes=RUN_CACHE_MAX_BYTES,
+                 index_path=RUN_INDEX_PATH, workers=CRAWL_WORKERS, remote=None, snapshot=None):
         self.path = path  # path is the directory symlinked to the web_viewer directory
-        self.pipeline_dir = self._get_dirs()
-
-    def _get_dirs(self):
-        """Steps through all the user directories and pipeline runs, calling Parser() for each."""
-        pipeline_dir = dict()
-        for user in walk(self.path).next()[1]:
-            temp_usr_data = dict()
-            for run in walk('%s/%s' % (self.path, user)).next()[1]:
-                if run[0] != '_' and isfile('static/plots/' + user + '/' + run + '/rf_pipeline_0.json'):  
-                    temp_usr_data[run] = Parser('static/plots/%s/%s' % (user, run))
-            pipeline_dir[user] = temp_usr_data
+        self.runs = RunCache(max_runs, max_bytes, RunIndex(index_path) if index_path is not None else None,
+                             RefreshScheduler(REFRESH_WORKERS), snapshot=snapshot)
+        self.errors = dict()  # {(user, run): error} for runs that couldn't be listed or parsed by the crawl
+        self.pipeline_dir = self._get_dirs(workers)  # {'user1': {'run1': 'path/to/run1', ...}, ...}
+        self.remote = remote
+        self.remote_runs = dict()  # {(user, run): (node, version)} for the runs in pipeline_dir from other machines
+        if remote is not None:
+            remote.refresh()
+            self._merge_remote()
+
+    def _get_dirs(self, workers=1):
+        """Steps through all the user directories and lists the pipeline runs in each. With more than one worker, 
+        the user directories are listed (and then the runs checked) by a pool of threads."""
+        users = walk(self.path).next()[1]
+        if workers <= 1:
+            return dict((user, self._update_user(user)) for user in users)
+        pool = ThreadPool(workers)
+        try:
+            runs = [(user, run) for user, user_runs in zip(users, pool.map(self._list_runs, users)) for run in user_runs]
+            listed = pool.map(self._check_run, runs)
+        finally:
+            pool.close()
+        pipeline_dir = dict((user, dict()) for user in users)
+        for (user, run), run_path in zip(runs, listed):
+            if run_path is not None:
+                pipeline_dir[user][run] = run_path
         return pipeline_dir
 
     def _update_user(self, user):
-        """This will just return the information to be added to the section of the dictionary for a particular user, 
-        not a whole new dictionary of parser instances, as _get_dirs does."""
+        """This will just return the runs to be added to the section of the dictionary for a particular user, 
+        not a whole new dictionary, as _get_dirs does."""
         temp_usr_data = dict()
-        for run in walk('%s/%s' % (self.path, user)).next()[1]:
-            if run[0] != '_' and isfile('static/plots/' + user + '/' + run + '/rf_pipeline_0.json'):
-                temp_usr_data[run] = Parser('static/plots/%s/%s' % (user, run))
+        for run in self._list_runs(user):
+            run_path = self._check_run((user, run))
+            if run_path is not None:
+                temp_usr_data[run] = run_path
         return temp_usr_data
 
+    def _list_runs(self, user):
+        """Returns the directories in a user's directory (or none, if it can't be read)."""
+        metrics.inc('web_viewer_user_rescans_total')
+        try:
+            return walk('%s/%s' % (self.path, user)).next()[1]
+        except StopIteration:
+            self.errors[(user, None)] = 'could not list %s/%s' % (self.path, user)
+            return []
+
+    def _check_run(self, user_run):
+        """Returns the path of a (user, run) if it's a pipeline run (i.e. has a json file), or None."""
+        user, run = user_run
+        run_path = '%s/%s/%s' % (self.path, user, run)
+        if run[0] != '_' and isfile(run_path + '/rf_pipeline_0.json'):
+            return run_path
+        return None
+
+    def warm(self, workers=CRAWL_WORKERS, processes=CRAWL_PROCESSES):
+        """Parses every listed local run that isn't already in the RunIndex (and the RunCache), so that nobody has 
+        to wait for it later (runs on other machines are warmed by their own viewers). A pool of worker threads 
+        reads the runs - the json files are parsed in those threads, or by a pool of processes if processes > 0. 
+        A run that can't be parsed is skipped (and its error kept in self.errors). Returns the number of runs that 
+        were read."""
+        runs = [(user, run) for user in self.pipeline_dir for run in self.pipeline_dir[user]
+                if (user, run) not in self.remote_runs]
+        process_pool = Pool(processes) if processes > 0 else None
+        if process_pool is not None:
+            read_files = lambda run_path: process_pool.apply(_read_files, (run_path,))
+        else:
+            read_files = _read_files
+
+        def warm_run(user_run):
+            user, run = user_run
+            try:
+                self.runs.get(user, run, self.pipeline_dir[user][run], read_files=read_files)
+                return True
+            except Exception as e:
+                self.errors[(user, run)] = repr(e)
+                return False
+
+        pool = ThreadPool(max(workers, 1))
+        try:
+            return sum(pool.map(warm_run, runs, chunksize=1))
+        finally:
+            pool.close()
+            if process_pool is not None:
+                process_pool.close()
+
+    def write_snapshot(self, path=SNAPSHOT_PATH, workers=CRAWL_WORKERS, processes=CRAWL_PROCESSES):
+        """Writes the file names and times of every local run to a snapshot (see snapshot.py), reading them like
+        warm() does (so from the RunIndex, if they're in it). Runs without any plots, and runs that can't be read,
+        are left out (their errors are kept in self.errors). Returns the number of runs written."""
+        runs = sorted((user, run) for user in self.pipeline_dir for run in self.pipeline_dir[user]
+                      if (user, run) not in self.remote_runs)
+        process_pool = Pool(processes) if processes > 0 else None
+        if process_pool is not None:
+            read_files = lambda run_path: process_pool.apply(_read_files, (run_path,))
+        else:
+            read_files = _read_files
+
+        def read_run(user_run):
+            user, run = user_run
+            try:
+                parser = self.runs.get(user, run, self.pipeline_dir[user][run], read_files=read_files)
+            except Exception as e:
+                self.errors[(user, run)] = repr(e)
+                return None
+            if parser.table is None:
+                return None
+            return user, run, parser.version, parser.table
+
+        pool = ThreadPool(max(workers, 1))
+        try:
+            # imap, so that only a few runs are held on to at a time (the RunCache may drop them as we go)
+            return write_snapshot(path, (entry for entry in pool.imap(read_run, runs) if entry is not None))
+        finally:
+            pool.close()
+            if process_pool is not None:
+                process_pool.close()
+
+    def add_run(self, user, run):
+        """Adds a single run to the listing (or reloads it, if its json has changed) without rescanning the rest 
+        of the user's directory. The user's dictionary is replaced rather than modified, so pages that are 
+        looking at the old one at the same time aren't affected."""
+        run_path = '%s/%s/%s' % (self.path, user, run)
+        if run[0] == '_' or not isfile(run_path + '/rf_pipeline_0.json'):
+            return False
+        metrics.inc('web_viewer_run_updates_total')
+        if run not in self.pipeline_dir.get(user, {}) or (user, run) in self.remote_runs:
+            temp_usr_data = dict(self.pipeline_dir.get(user, {}))
+            temp_usr_data[run] = run_path
+            self.pipeline_dir[user] = temp_usr_data
+            self.remote_runs.pop((user, run), None)  # local runs win over ones with the same name elsewhere
+        self.get_run(user, run)
+        return True
+
+    def remove_run(self, user, run):
+        """Removes a run that has been deleted from the listing."""
+        if run in self.pipeline_dir.get(user, {}):
+            temp_usr_data = dict(self.pipeline_dir[user])
+            del temp_usr_data[run]
+            self.pipeline_dir[user] = temp_usr_data
+
+    def has_run(self, user, run):
+        """Checks whether a run is in the listing. If it isn't (the watcher may not have noticed it yet), only 
+        that run's directory is checked - the user's other runs are left alone."""
+        return run in self.pipeline_dir.get(user, {}) or self.add_run(user, run)
+
+    def get_run(self, user, run, validate=True):
+        """Returns the Parser for a listed run (or None if we don't know about it)."""
+        run_path = self.pipeline_dir.get(user, {}).get(run)
+        if run_path is None:
+            return None
+        remote_run = self.remote_runs.get((user, run))
+        if remote_run is not None:
+            node, version = remote_run
+            # Fetched in the background like a local run is parsed, so pages don't wait on the other machine
+            return self.runs.get(user, run, run_path, validate, version=version, background=True,
+                                 read_files=lambda run_path: self.remote.read_files(node, user, run))
+        return self.runs.get(user, run, run_path, validate)
+
+    def check_remote(self):
+        """Fetches the other machines' run lists again (in the background) once they're more than 
+        REMOTE_INDEX_TTL seconds old."""
+        if self.remote is not None and self.remote.is_stale():
+            self.runs.refresher.submit('remote', self._update_remote)
+
+    def _update_remote(self):
+        if self.remote.refresh():
+            self._merge_remote()
+
+    def _merge_remote(self):
+        """Adds the runs listed by the other machines to pipeline_dir, and removes the ones they don't list any more.
+        A local run is kept over one with the same name elsewhere. The users' dictionaries are replaced rather than
+        modified, like in add_run()."""
+        old_runs = self.remote_runs
+        new_runs = dict((user_run, remote_run) for user_run, remote_run in self.remote.merged().items()
+                        if user_run in old_runs or user_run[1] not in self.pipeline_dir.get(user_run[0], {}))
+        self.remote_runs = dict(old_runs)
+        self.remote_runs.update(new_runs)  # until the old ones are gone from pipeline_dir
+        for user in set(user for user, run in old_runs) | set(user for user, run in new_runs):
+            temp_usr_data = dict((run, run_path) for run, run_path in self.pipeline_dir.get(user, {}).items()
+                                 if (user, run) not in old_runs)
+            for (run_user, run), (node, version) in new_runs.items():
+                if run_user == user:
+                    temp_usr_data[run] = node + quote_path('plots', user, run)
+            self.pipeline_dir[user] = temp_usr_data
+        self.remote_runs = new_runs
+
+    def remote_user_runs(self, user):
+        """Returns the names of a user's runs on other machines."""
+        return set(run for run_user, run in self.remote_runs if run_user == user)
+
     def __str__(self):
         s = ""
         # For not writing out a ridiculous amount of information when trying to debug
@@ -224,10 +753,67 @@ class Crawler():
                 for run in self.pipeline_dir[user]:
                     s += '-' * 160 + '\n'
                     s +=  "RUN: %s\n" % run
-                    s += self.pipeline_dir[user][run].__str__()
+                    s += self.get_run(user, run).__str__()
         return s
 
 
+def _load_snapshot(snapshot_path):
+    """Maps the shared snapshot (see snapshot.py), if there is one. A snapshot that can't be read is ignored, 
+    since every run can still be read the usual way."""
+    if snapshot_path is None or not exists(snapshot_path):
+        return None
+    try:
+        return RunSnapshot(snapshot_path)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _read_files(run_path):
+    """Reads (fnames, ftimes) from a run's json without building a PlotTable. This is a plain function (rather than 
+    a Parser method) so that Crawler.warm() can run it in a process pool."""
+    return Parser._get_files(run_path)
+
+
+class PageCache():
+    """
+    Keeps the most recently rendered viewer pages (with their ETags), so people paging back and forth through 
+    a run don't make us build the same pages over and over. Pages are keyed by the page's arguments and the 
+    version of the run they show, so pages for a run whose json has since changed are never reused (they just 
+    fall out of the cache). The least recently used pages are dropped once they take up more than max_bytes. 
+    """
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pages = OrderedDict()  # {key: (page, etag)}, least recently used first
+        self._lock = Lock()
+        self.lookups = 0  # for the /metrics page
+        self.hits = 0
+
+    def get(self, key):
+        """Returns (page, etag) for a key, or None if we don't have it."""
+        with self._lock:
+            self.lookups += 1
+            entry = self._pages.pop(key, None)
+            if entry is not None:
+                self.hits += 1
+                self._pages[key] = entry
+            return entry
+
+    def put(self, key, page, etag):
+        with self._lock:
+            old_entry = self._pages.pop(key, None)
+            if old_entry is not None:
+                self.size -= len(old_entry[0])
+            self._pages[key] = (page, etag)
+            self.size += len(page)
+            while self._pages and self.size > self.max_bytes:
+                key, entry = self._pages.popitem(last=False)
+                self.size -= len(entry[0])
+
+    def __len__(self):
+        return len(self._pages)
+
+
 """
 This used to be a class for the web_viewer application, but I soon found that Flask Classy doesn't 
 interface properly with wsgi :'( Now, it is merely a collection of functions for loading pages of the 
@@ -242,25 +828,346 @@ Show last transform is the same as Show triggers, but for the second last plotti
 If __init__ is present, it will be called once for each page when the viewer starts (hence, no
 __init__ method). 
 """
-def _get_run_info(user, run):
+def _get_run_info(user, run, validate=True):
     # Get parser object for corresponding user/run (since this is no longer a class, I 
-    # don't think there's a better way to do this)
-    fnames = master_directories.pipeline_dir[user][run].fnames
-    ftimes = master_directories.pipeline_dir[user][run].ftimes
-    min_zoom = master_directories.pipeline_dir[user][run].min_zoom
-    min_index = master_directories.pipeline_dir[user][run].min_index
-    max_zoom = master_directories.pipeline_dir[user][run].max_zoom
-    max_index = master_directories.pipeline_dir[user][run].max_index
+    # don't think there's a better way to do this). The pages only validate the cached
+    # run once, the _check functions just reuse it. 
+    parser = master_directories.get_run(user, run, validate)
+    fnames = parser.fnames
+    ftimes = parser.ftimes
+    min_zoom = parser.min_zoom
+    min_index = parser.min_index
+    max_zoom = parser.max_zoom
+    max_index = parser.max_index
     return fnames, ftimes, min_zoom, min_index, max_zoom, max_index
 
+def _cached_page(page):
+    """Decorator for the pages that show a single run. The rendered page is kept in the page_cache, and sent with 
+    a strong ETag (a hash of the page) and a Last-Modified header (the run's json modification time), so that 
+    browsers that already have the page just get a 304 back."""
+    @wraps(page)
+    def cached_page(user, run, **kwargs):
+        if not master_directories.has_run(user, run):
+            return page(user, run, **kwargs)
+        version = master_directories.get_run(user, run).version
+        key = (page.__name__, user, run, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items())), version)
+        cached = page_cache.get(key)
+        if cached is None:
+            response = make_response(page(user, run, **kwargs))
+            if response.is_streamed:
+                # The page is sent as it's rendered (see _stream_template()), so it can't have an ETag yet - the
+                # copy kept in the cache once it's finished gets one
+                response.response = _cache_stream(key, response.response)
+                response.last_modified = datetime.utcfromtimestamp(int(version[0]))
+                response.cache_control.no_cache = True
+                return response
+            data = response.get_data()
+            cached = (data, md5(data).hexdigest())
+            page_cache.put(key, *cached)
+        response = make_response(cached[0])
+        response.set_etag(cached[1])
+        response.last_modified = datetime.utcfromtimestamp(int(version[0]))
+        response.cache_control.no_cache = True  # the run may still change, so browsers should always check
+        return response.make_conditional(request)
+    return cached_page
+
+def _cache_stream(key, chunks):
+    # Passes a streamed page through, and puts the whole thing in the page_cache once it has all been sent
+    data = []
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        data.append(chunk)
+        yield chunk
+    data = b''.join(data)
+    page_cache.put(key, data, md5(data).hexdigest())
+
+def _stream_template(template, **context):
+    """Renders one of the page templates into a streamed response, so the browser can start loading the first 
+    plots while the rest of the page is still being made."""
+    stream = template.stream(**context)
+    stream.enable_buffering(TEMPLATE_STREAM_BUFFER)
+    return Response(stream_with_context(stream))
+
+@app.before_request
+def _start_watcher():
+    # Threads don't survive uwsgi forking its workers, so each worker starts its own watcher 
+    # the first time it handles a request
+    global watcher
+    if watcher is None or watcher.pid != getpid():
+        watcher = RunWatcher(master_directories, WATCH_POLL_INTERVAL)
+        watcher.pid = getpid()
+        watcher.start()
+
+@app.before_request
+def _check_remote():
+    # The other machines' run lists are kept up to date in the background, like the local ones
+    master_directories.check_remote()
+
+@app.before_request
+def _start_timer():
+    g.request_start = default_timer()
+
+@app.after_request
+def _record_request(response):
+    """Records how long each request took and how big its response was for the /metrics page, once the response has 
+    been sent (streamed pages are only timed and counted once the last of them has gone)."""
+    start = getattr(g, 'request_start', None)
+    if start is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule is not None else 'not_found'
+    view_args = dict(request.view_args or {})
+    path = request.full_path
+    sent = [response.calculate_content_length()]
+    if sent[0] is None and response.is_streamed and not response.direct_passthrough:
+        sent[0] = 0
+        response.response = _count_bytes(response.response, sent, response.charset)
+
+    def record():
+        duration = default_timer() - start
+        metrics.observe('web_viewer_request_duration_seconds', duration, endpoint=endpoint)
+        metrics.inc('web_viewer_requests_total', endpoint=endpoint, status=response.status_code)
+        if sent[0] is not None:
+            metrics.observe('web_viewer_response_size_bytes', sent[0], endpoint=endpoint)
+        if SLOW_REQUEST_SECONDS is not None and duration >= SLOW_REQUEST_SECONDS:
+            app.logger.warning('Slow request (%.2f s): %s user=%s run=%s zoom=%s plots=%s-%s', duration, path,
+                               view_args.get('user'), view_args.get('run'), view_args.get('zoom'),
+                               view_args.get('index1'), view_args.get('index2'))
+        metrics.maybe_flush()
+    if response.direct_passthrough:
+        record()  # files are handed straight to uwsgi (or sendfile()), and we don't hear when they're done
+    else:
+        response.call_on_close(record)
+    return response
+
+def _count_bytes(chunks, sent, charset):
+    # Passes a streamed response through, adding up its size in sent[0]
+    for chunk in chunks:
+        sent[0] += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode(charset))
+        yield chunk
+
+@app.errorhandler(RunNotReady)
+def run_not_ready(e):
+    """Asked for a run that's still being parsed in the background: the page reloads itself a few seconds later."""
+    response = make_response('<html><head><meta http-equiv="refresh" content="5"></head><body>'
+                             '<p>This run is still being loaded, the page will refresh in a few seconds.</p></body></html>', 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Request, parsing and cache metrics for all of the workers, in the Prometheus text format (see metrics.py)."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def _collect_metrics(metrics):
+    # Called for each metrics snapshot, to fill in the things we don't count as they happen
+    metrics.set('web_viewer_runs_in_memory', len(master_directories.runs))
+    metrics.set('web_viewer_plots_in_memory', master_directories.runs.plots)
+    metrics.set('web_viewer_run_cache_bytes', master_directories.runs.size)
+    metrics.set('web_viewer_page_cache_bytes', page_cache.size)
+    metrics.set('web_viewer_listing_rescans_total', listing.rescans)
+    metrics.set('web_viewer_snapshot_hits_total', master_directories.runs.snapshot_hits)
+    if master_directories.remote is not None:
+        for node, pool in master_directories.remote.pools.items():
+            metrics.set('web_viewer_remote_requests_total', pool.requests, node=node)
+            metrics.set('web_viewer_remote_connections_total', pool.connections, node=node)
+    for cache, lookups, hits in (('run', master_directories.runs.lookups, master_directories.runs.hits),
+                                 ('page', page_cache.lookups, page_cache.hits),
+                                 ('thumbnail', thumbnails.hits + thumbnails.misses, thumbnails.hits),
+                                 ('variant', variants.hits + variants.misses, variants.hits),
+                                 ('alignment', alignments.lookups, alignments.hits)):
+        metrics.set('web_viewer_cache_lookups_total', lookups, cache=cache)
+        metrics.set('web_viewer_cache_hits_total', hits, cache=cache)
+
+@app.route("/plots/<string:user>/<string:run>/<path:filename>")
+def plot(user, run, filename):
+    """Sends a single plot. Plots from runs with timestamped names are marked as immutable and can be cached 
+    by browsers for PLOT_MAX_AGE. Otherwise browsers have to check with us (using the ETag) before reusing 
+    them. Ranges are supported, and uwsgi uses sendfile() for the file itself (unless PLOT_SENDFILE_MODE 
+    hands that to the web server). Plots from other machines are proxied or redirected to (see _remote_file())."""
+    if (user, run) in master_directories.remote_runs:
+        return _remote_file(user, run, 'plots', filename)
+    filename = '%s/%s/%s' % (user, run, filename)
+    if PLOT_SENDFILE_MODE == 'x-accel-redirect':
+        if not isfile(safe_join(path, filename)):
+            abort(404)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = PLOT_ACCEL_REDIRECT_PREFIX + filename
+        response.headers['Content-Type'] = ''  # let nginx work this out
+    else:
+        response = send_from_directory(abspath(path), filename, conditional=True)
+
+    return _set_plot_caching(response, run)
+
+@app.route("/thumbnails/<string:user>/<string:run>/<path:filename>")
+def thumbnail(user, run, filename):
+    """Sends a thumbnail of a plot (see thumbnails.py), as a WebP if the browser accepts them. If the thumbnail 
+    hasn't been made yet (it's made in the background, for next time) or can't be made (e.g. we can't write to 
+    the run's directory), this just redirects to the full plot."""
+    if (user, run) in master_directories.remote_runs:
+        return _remote_file(user, run, 'thumbnails', filename)
+    plot_path = safe_join(path, '%s/%s/%s' % (user, run, filename))
+    fmt = 'webp' if thumbnails.webp and _accepts_webp() else 'png'
+    try:
+        thumb_path = thumbnails.get(plot_path, fmt)
+    except (IOError, OSError):
+        thumb_path = None
+    if thumb_path is None:
+        return redirect(url_for('plot', user=user, run=run, filename=filename))
+    response = send_file(abspath(thumb_path), conditional=True)
+    response.vary.add('Accept')
+    return _set_plot_caching(response, run)
+
+@app.route("/variants/<string:user>/<string:run>/<path:filename>")
+def variant(user, run, filename):
+    """Sends a smaller version of a plot (see variants.py): a WebP if the browser accepts them, and a PNG with a 
+    256 colour palette otherwise, unless ?format= (webp or png) says which. ?quality= (1-100, for WebPs) and 
+    ?width= (at most this many pixels wide) can be given too. If the variant hasn't been made yet (it's made in 
+    the background, for next time) or can't be made, the plot itself is sent straight away, but browsers aren't 
+    allowed to keep it."""
+    if (user, run) in master_directories.remote_runs:
+        return _remote_file(user, run, 'variants', filename)
+    plot_path = safe_join(path, '%s/%s/%s' % (user, run, filename))
+    fmt = request.args.get('format')
+    if fmt not in VARIANT_FORMATS:
+        fmt = 'webp' if variants.webp and _accepts_webp() else 'png'
+    quality = min(max(request.args.get('quality', VARIANT_QUALITY, type=int), 1), 100)
+    width = request.args.get('width', type=int)
+    try:
+        variant_path = variants.get(plot_path, fmt, quality, max(width, 1) if width is not None else None)
+    except (IOError, OSError, ValueError):
+        variant_path = None
+    if variant_path is None:
+        metrics.inc('web_viewer_variant_fallbacks_total')
+        response = plot(user, run, filename)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers.pop('Expires', None)
+        return response
+    response = send_file(variant_path, conditional=True)
+    if 'format' not in request.args:
+        response.vary.add('Accept')
+    return _set_plot_caching(response, run)
+
+def _remote_file(user, run, kind, filename):
+    """Sends a plot (or a thumbnail or variant, if kind is 'thumbnails' or 'variants') of a run on another 
+    machine. With REMOTE_PLOT_MODE = 'proxy', it's fetched from that machine's viewer over a kept-alive 
+    connection and passed straight on, along with its caching headers (and the browser's conditional and range 
+    headers are passed the other way). If that viewer redirects (e.g. to the full plot, for a thumbnail that 
+    isn't ready yet), the browser is redirected to the same path here instead, since it can't reach the other 
+    machine. Otherwise (without 'proxy') the browser is redirected to it."""
+    node = master_directories.remote_runs[(user, run)][0]
+    node_path = quote_path(kind, user, run, filename)
+    if request.query_string:
+        node_path += '?' + request.query_string.decode('ascii')  # e.g. a variant's settings
+    if REMOTE_PLOT_MODE != 'proxy':
+        return redirect(node + node_path)
+    headers = dict((name, request.headers[name]) for name in ('Accept', 'If-None-Match', 'If-Modified-Since', 'Range')
+                   if name in request.headers)
+    try:
+        remote_response, body = master_directories.remote.open(node, node_path, headers)
+    except RemoteError:
+        abort(502)
+    location = remote_response.getheader('Location')
+    if location is not None and 300 <= remote_response.status < 400:
+        for chunk in body:
+            pass  # read to the end, so the connection goes back in the pool
+        return redirect(request.script_root + master_directories.remote.node_path(node, location), 
+                        remote_response.status)
+    response = Response(body, status=remote_response.status)
+    for name in ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified', 
+                 'Cache-Control', 'Expires', 'Vary'):
+        value = remote_response.getheader(name)
+        if value is not None:
+            response.headers[name] = value
+    return response
+
+def _accepts_webp():
+    # Only browsers that name image/webp in their Accept header get WebPs - accept_mimetypes['image/webp'] would 
+    # also be true for */* and image/*, which plenty of clients without WebP send
+    return any(mimetype == 'image/webp' and quality > 0 for mimetype, quality in request.accept_mimetypes)
+
+def _set_plot_caching(response, run):
+    # Plots never change once they're written, and run names end in the time they were started, so 
+    # plots from those runs can be cached for good
+    if search(r'\d\d-\d\d-\d\d-\d\d:\d\d:\d\d$', run):
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % PLOT_MAX_AGE
+        response.expires = datetime.utcnow() + timedelta(seconds=PLOT_MAX_AGE)
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route("/<string:user>/<string:run>/mosaic/<int:zoom>/<int:index1>/<int:index2>")
+def mosaic(user, run, zoom, index1, index2):
+    """Sends the mosaic of a Show Tiles window. The page's link includes the run's json modification time, so 
+    the mosaic can be cached like a plot."""
+    if not master_directories.has_run(user, run) or master_directories.get_run(user, run).max_index is None or \
+            (user, run) in master_directories.remote_runs:
+        abort(404)
+    try:
+        mosaic_path, areas = _get_mosaic(user, run, zoom, index1, index2)
+    except (IOError, OSError):
+        abort(404)
+    return _set_plot_caching(send_file(abspath(mosaic_path), conditional=True), run)
+
+def _get_mosaic(user, run, zoom, index1, index2):
+    # Returns (path, areas) for the mosaic of a Show Tiles window, with the same rows as the tiled view
+    parser = master_directories.get_run(user, run, validate=False)
+    rows = []
+    for transform in reversed(range(len(parser.fnames))):
+        rows.append([(parser.fnames[transform][zoom][index], '%s' % parser.ftimes[transform][zoom][index])
+                     for index in range(index1, index2 + 1) if _check_image(user, run, transform, zoom, index)])
+    return mosaics.get(master_directories.pipeline_dir[user][run], (zoom, index1, index2, parser.version), rows)
+
+def _mosaic_html(user, run, zoom, index1, index2):
+    """The mosaic for a Show Tiles window, with an image map linking each plot to the full size version 
+    (falling back to an error message if the mosaic can't be made)."""
+    try:
+        mosaic_path, areas = _get_mosaic(user, run, zoom, index1, index2)
+    except (IOError, OSError):
+        return '<p>Some of these plots could not be read, so the mosaic could not be made.</p>'
+    version = master_directories.get_run(user, run, validate=False).version
+    display = '<p><img src="%s" usemap="#tiles"></p><map name="tiles">' \
+              % url_for('mosaic', user=user, run=run, zoom=zoom, index1=index1, index2=index2, v=int(version[0]))
+    for x0, y0, x1, y1, filename, label in areas:
+        display += '<area shape="rect" coords="%d,%d,%d,%d" href="%s" title="%s">' \
+                   % (x0, y0, x1, y1, url_for('plot', user=user, run=run, filename=filename), label)
+    display += '</map>'
+    return display
+
+def _plot_url_bases(user, run):
+    """Returns the urls of a run's plots, of the images to show them with on the Show Triggers/Show Last Transform 
+    pages (thumbnails, if we can make them), and of the ones to show them with on the Show Tiles page and the Fast 
+    Viewer (variants, if we can make them), without the file names. Adding a file name quoted by _quote_filename() 
+    gives the same url as url_for(), without calling url_for() for every plot on a page. Exported pages (see 
+    export_run()) are sent by a plain web server, so theirs point straight at the plot files, and at the 
+    thumbnails exported with them."""
+    if g.get('export'):
+        plot_base = url_for('static', filename='plots/%s/%s/_' % (user, run))[:-1]
+        image_base = plot_base + EXPORT_DIR + '/thumbnails/' if thumbnails.available else plot_base
+        return plot_base, image_base, plot_base
+    plot_base = url_for('plot', user=user, run=run, filename='_')[:-1]
+    image_base = url_for('thumbnail', user=user, run=run, filename='_')[:-1] if thumbnails.available else plot_base
+    variant_base = url_for('variant', user=user, run=run, filename='_')[:-1] if variants.available else plot_base
+    return plot_base, image_base, variant_base
+
+def _tiles_url_base(user, run):
+    # The Show Tiles url for a run without the zoom and indices (see _overview_link())
+    return url_for('show_tiles', user=user, run=run, zoom=0, index1=0, index2=0)[:-len('0/0/0')]
+
+def _quote_filename(filename):
+    # Quotes a file name the same way as url_for() does for the <path:filename> in the plot urls
+    return url_quote(filename, safe='/:')
+
 @app.route("/")
 def index():
     """Home page! Links to each of the users' pipeline runs."""
 
     display = '<h3>Users</h3>'
 
-    # Check for new users
-    for user in walk(path).next()[1]:
+    # Check for new users (the users who only have runs on other machines go at the end)
+    users = listing.users()
+    users = users + sorted(set(user for user, run in master_directories.remote_runs) - set(users))
+    for user in users:
         display += '<li><a href="%s">%s</a>\n' % (url_for('runs', user=user), user)
 
     display += '<p><a href="https://github.com/mburhanpurkar/web_viewer">Instructions / Help / Documentation</a></p>'
@@ -268,44 +1175,303 @@ def index():
 
 @app.route("/<string:user>/runs")
 def runs(user):
-    """Displays links to the pipeline runs for a particular user."""
+    """Displays links to the pipeline runs for a particular user. The runs come from the cached listing (already
+    grouped by prefix and sorted), and the page is only rebuilt when they change."""
+    version, sorted_runs = listing.runs(user)  # [(prefix1, [run1, run2, run3, ...]), (prefix2, [...]), ...]
+    remote_runs = master_directories.remote_user_runs(user)
+    if remote_runs:
+        sorted_runs = group_runs(remote_runs.union(run for prefix, prefix_runs in sorted_runs for run in prefix_runs))
+        version = (version, master_directories.remote.version)
+    key = ('runs', user, version)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return cached[0]
 
     display = '<h3>%s\'s pipeline runs</h3>' % user
     display += '<p>[&nbsp;&nbsp;&nbsp;<a href="%s">Back to List of Users</a>&nbsp;&nbsp;&nbsp;]' % url_for('index')
 
-    # Sort runs by prefix {prefix1: [run1, run2, run3, ...], prefix2: [...], ...}
-    sorted_runs = dict()
-    for run in walk(path + '/' + user).next()[1]:
-        if exists(path + '/' + user + '/' + run + '/' + 'rf_pipeline_0.json'):
-            prefix = run[:-18]
-            if prefix not in sorted_runs:
-                # We need to add a new key
-                sorted_runs[prefix] = [run]
-            else:
-                # Add to existing list
-                sorted_runs[prefix].append(run)
-
-    for prefix in sorted(sorted_runs):
+    for prefix, prefix_runs in sorted_runs:
         display += '<h4>%s</h4>' % prefix
-        for run in sorted(sorted_runs[prefix]):
+        if len(prefix_runs) > 1 and prefix:
+            display += '<li><a href="%s">Compare these runs</a>\n' % url_for('compare', user=user, prefix=prefix, zoom=0, 
+                                                                             index1=0, index2=COMPARE_COLUMNS - 1)
+        for run in prefix_runs:
             display += '<h5>%s</h5>' % run[-17:]
             display += '<li><a href="%s">Show Tiles</a>\n' % url_for('show_tiles', user=user, run=run, zoom=0, index1=0, index2=3)
             display += '<li><a href="%s">Show Triggers</a>\n' % url_for('show_triggers', user=user, run=run, zoom=0)
             display += '<li><a href="%s">Show Last Transform</a>\n' % url_for('show_last_transform', user=user, run=run, zoom=0)
+    page_cache.put(key, display, None)
+    return display
+
+@app.route("/<string:user>/<string:run>/viewer/<int:zoom>/<int(signed=True):index1>/<int(signed=True):index2>")
+def viewer(user, run, zoom, index1, index2):
+    """The same as Show Tiles, but all of the navigation happens in the browser: the page gets the run's file names 
+    and times from run_meta() once, works out which plots to show itself, and loads the plots either side of the 
+    current ones in the background, so stepping through a run doesn't need the server at all."""
+    if not master_directories.has_run(user, run):
+        return "The run was not found."
+    display = '<p><center>[&nbsp;&nbsp;&nbsp;<a href="%s">Back to Users List</a>&nbsp;&nbsp;&nbsp;<a href="%s">Back to Your Runs</a>' \
+              '&nbsp;&nbsp;&nbsp;]</center></p>' % (url_for('index'), url_for('runs', user=user))
+    # The urls for other windows are built by the script, so it gets them without the zoom and indices
+    display += '<div id="viewer" data-meta="%s" data-base="%s" data-tiles-base="%s" data-window="%d/%d/%d"></div>' \
+               % (url_for('run_meta', user=user, run=run),
+                  url_for('viewer', user=user, run=run, zoom=0, index1=0, index2=0)[:-len('0/0/0')],
+                  url_for('show_tiles', user=user, run=run, zoom=0, index1=0, index2=0)[:-len('0/0/0')],
+                  zoom, index1, index2)
+    display += '<noscript><p><a href="%s">This page needs javascript - try Show Tiles instead</a></p></noscript>' \
+               % url_for('show_tiles', user=user, run=run, zoom=zoom, index1=max(index1, 0), index2=max(index2, 0))
+    display += _VIEWER_SCRIPT
     return display
 
+# The browser side of viewer(). The navigation is exactly the same as in show_tiles(), including its
+# (python 2) arithmetic for keeping the number of columns the same when zooming.
+_VIEWER_SCRIPT = """<script>
+(function() {
+    var viewer = document.getElementById('viewer');
+    var base = viewer.getAttribute('data-base');
+    var tilesBase = viewer.getAttribute('data-tiles-base');
+    var meta = null;
+    var prefetched = {};
+
+    function checkSet(zoom, index) {
+        return zoom >= 0 && zoom < meta.max_zoom && index >= 0 && index < meta.zoom_max_index[zoom];
+    }
+
+    function checkImage(transform, zoom, index) {
+        return zoom >= 0 && zoom < meta.max_zoom && index >= 0 && index < meta.max_index[transform][zoom];
+    }
+
+    function plotUrl(transform, zoom, index) {
+        return meta.plot_url + encodeURIComponent(meta.fnames[transform][zoom][index]);
+    }
+
+    function zoomIn(index1, index2) {
+        var d = index2 - index1;
+        if (d % 2 == 0)
+            return [index1 * 2 + Math.floor(d / 2), index2 * 2 - Math.floor(d / 2)];
+        return [Math.trunc(index1 * 2 + d / 2 + 1), Math.trunc(index2 * 2 - d / 2 + 1)];
+    }
+
+    function zoomOut(index1, index2) {
+        var d = index2 - index1;
+        var h = Math.floor(d / 2);
+        if (d % 2 == 0)
+            return [Math.floor((index1 - h) / 2), Math.floor((index2 + h) / 2)];
+        return [Math.trunc((index1 - h) / 2), Math.trunc((index2 + h + 1) / 2)];
+    }
+
+    // [name, zoom, index1, index2, enabled] for each of the navigation links
+    function links(zoom, index1, index2) {
+        var d = index2 - index1;
+        var zin = zoomIn(index1, index2);
+        var zout = zoomOut(index1, index2);
+        return [['Prev Time', zoom, index1 - 1, index2 - 1, checkSet(zoom, index1 - 1)],
+                ['Next Time', zoom, index1 + 1, index2 + 1, checkSet(zoom, index1 + 1)],
+                ['Jump Back', zoom, index1 - d, index2 - d, checkSet(zoom, index1 - d)],
+                ['Jump Forward', zoom, index1 + d, index2 + d, checkSet(zoom, index1 + d)],
+                ['Zoom In', zoom + 1, zin[0], zin[1], checkSet(zoom + 1, index1 * 2)],
+                ['Zoom Out', zoom - 1, zout[0], zout[1], checkSet(zoom - 1, Math.floor(index1 / 2))]];
+    }
+
+    function prefetch(zoom, index1, index2) {
+        for (var transform = 0; transform < meta.fnames.length; transform++) {
+            for (var index = index1; index <= index2; index++) {
+                if (checkImage(transform, zoom, index) && !prefetched[plotUrl(transform, zoom, index)]) {
+                    prefetched[plotUrl(transform, zoom, index)] = true;
+                    new Image().src = plotUrl(transform, zoom, index);
+                }
+            }
+        }
+    }
+
+    function show(zoom, index1, index2) {
+        var html = '<h3>Displaying Plots ' + index1 + '-' + index2 + ' at Zoom ' + (meta.max_zoom - zoom - 1) + '</h3>';
+        html += '<table cellspacing="0" cellpadding="0">';
+        for (var transform = meta.fnames.length - 1; transform >= 0; transform--) {
+            var times = '';
+            var images = '';
+            for (var index = index1; index <= index2; index++) {
+                if (checkImage(transform, zoom, index)) {
+                    times += '<td>' + meta.ftimes[transform][zoom][index] + '</td>';
+                    images += '<td><img src="' + plotUrl(transform, zoom, index) + '"></td>';
+                }
+            }
+            html += '<tr>' + times + '</tr><tr>' + images + '</tr><tr><td>&nbsp;</td></tr>';
+        }
+        html += '</table><p><center>[&nbsp;&nbsp;&nbsp;';
+        var windows = links(zoom, index1, index2);
+        windows.forEach(function(link) {
+            if (link[4])
+                html += '<a href="' + base + link[1] + '/' + link[2] + '/' + link[3] + '" data-window="' + 
+                        link[1] + '/' + link[2] + '/' + link[3] + '">' + link[0] + '</a>&nbsp;&nbsp;&nbsp;';
+            else
+                html += link[0] + '&nbsp;&nbsp;&nbsp;';
+        });
+        html += ']</center></p><p><center>[&nbsp;&nbsp;&nbsp;<a href="' + tilesBase + zoom + '/' + index1 + '/' + index2 + 
+                '">Show Tiles</a>&nbsp;&nbsp;&nbsp;]</center></p>';
+        viewer.innerHTML = html;
+
+        Array.prototype.forEach.call(viewer.querySelectorAll('a[data-window]'), function(a) {
+            a.onclick = function() {
+                history.pushState(null, '', a.href);
+                showWindow(a.getAttribute('data-window'));
+                return false;
+            };
+        });
+        // Get the plots for the next and previous steps ready
+        windows.slice(0, 4).forEach(function(link) {
+            if (link[4])
+                prefetch(link[1], link[2], link[3]);
+        });
+    }
+
+    function showWindow(spec) {
+        var parts = spec.split('/').map(Number);
+        show(parts[0], parts[1], parts[2]);
+    }
+
+    window.addEventListener('popstate', function() {
+        showWindow(location.pathname.split('/').slice(-3).join('/'));
+    });
+
+    var request = new XMLHttpRequest();
+    request.open('GET', viewer.getAttribute('data-meta'));
+    request.onload = function() {
+        if (request.status != 200) {
+            viewer.innerHTML = 'The run could not be displayed.';
+            return;
+        }
+        meta = JSON.parse(request.responseText);
+        showWindow(viewer.getAttribute('data-window'));
+    };
+    request.send();
+})();
+</script>"""
+
+@app.route("/<string:user>/<string:run>/at/<string:time>")
+@app.route("/<string:user>/<string:run>/at/<string:time>/<int:zoom>")
+def at(user, run, time, zoom=None):
+    """Jumps to the Show Tiles page with the plot covering an absolute time (in the same seconds shown above the 
+    plots, e.g. an L1 trigger time) in the middle, at the given zoom (the most zoomed in by default). The number
+    of plots across can be changed with ?columns=..."""
+    if not master_directories.has_run(user, run):
+        return "The run was not found."
+    try:
+        time = float(time)
+    except ValueError:
+        abort(404)
+    parser = master_directories.get_run(user, run)
+    if parser.max_index is None:
+        return 'This pipeline run cannot be displayed.'
+    transform = len(parser.fnames) - 1  # the L1 triggers
+    zoom = len(parser.fnames[transform]) - 1 if zoom is None else zoom
+    if not 0 <= zoom < len(parser.fnames[transform]):
+        abort(404)
+    columns = max(request.args.get('columns', AT_COLUMNS, type=int), 1)
+    return redirect(_at_url(user, run, zoom, int(parser.table.find_times(transform, zoom, time)), columns))
+
+def _at_url(user, run, zoom, index, columns):
+    # Show Tiles window of columns plots, with the plot at index in the middle (as much as possible)
+    index1 = max(index - columns // 2, 0)
+    return url_for('show_tiles', user=user, run=run, zoom=zoom, index1=index1, index2=index1 + columns - 1)
+
+@app.route("/api/<string:user>/<string:run>/at", methods=['GET', 'POST'])
+def at_api(user, run):
+    """Looks up lots of times at once, for scripts. The times are given as ?time=...&time=... or posted as json
+    ({"times": [...], "zoom": ...}), along with an optional zoom (the most zoomed in by default). Returns 
+    {"zoom": ..., "plots": [{"time", "index", "start", "filename", "tiles"}, ...]} with the trigger plot covering 
+    each time, its start time and the Show Tiles page from at()."""
+    if not master_directories.has_run(user, run):
+        abort(404)
+    parser = master_directories.get_run(user, run)
+    if parser.max_index is None:
+        abort(404)
+    args = request.get_json(silent=True) or dict()
+    try:
+        times = [float(time) for time in args.get('times', request.args.getlist('time'))]
+        zoom = int(args.get('zoom', request.args.get('zoom', len(parser.fnames[-1]) - 1)))
+    except (TypeError, ValueError):
+        abort(400)
+    transform = len(parser.fnames) - 1
+    if not 0 <= zoom < len(parser.fnames[transform]):
+        abort(404)
+
+    columns = max(request.args.get('columns', AT_COLUMNS, type=int), 1)
+    plots = []
+    for time, index in zip(times, parser.table.find_times(transform, zoom, times)):
+        index = int(index)
+        plots.append({'time': time, 'index': index, 'start': parser.ftimes[transform][zoom][index],
+                      'filename': parser.fnames[transform][zoom][index], 'tiles': _at_url(user, run, zoom, index, columns)})
+    return jsonify(zoom=zoom, plots=plots)
+
+@app.route("/api/runs")
+def runs_api():
+    """The runs on this machine, for the viewers on other machines that show them too (see remote.py), as json: 
+    {"runs": {user: {run: [mtime, size]}}} with the modification time and size of each run's rf_pipeline_0.json.
+    It has an ETag, so they can check whether anything has changed without getting the whole list again."""
+    local_runs = dict()
+    for user, user_runs in list(master_directories.pipeline_dir.items()):
+        for run, run_path in user_runs.items():
+            if (user, run) in master_directories.remote_runs:
+                continue  # only our own
+            try:
+                json_stat = stat(run_path + '/rf_pipeline_0.json')
+            except OSError:
+                continue  # deleted since it was listed
+            local_runs.setdefault(user, dict())[run] = [json_stat.st_mtime, json_stat.st_size]
+    response = jsonify(runs=local_runs)
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route("/api/<string:user>/<string:run>/meta")
+def run_meta(user, run):
+    """Everything the browser needs to show a run itself, as json: {"max_zoom", "max_index", "zoom_max_index", 
+    "fnames", "ftimes", "plot_url"} where plot_url is the start of the url for each plot's image (its variant, 
+    see variant() - the file name goes on the end). This is gzipped (if the browser accepts it, which they all do) and kept in the page_cache, 
+    and has the same ETag/Last-Modified handling as the pages."""
+    if not master_directories.has_run(user, run):
+        abort(404)
+    parser = master_directories.get_run(user, run)
+    if parser.max_index is None:
+        abort(404)
+
+    key = ('run_meta', user, run, parser.version)
+    cached = page_cache.get(key)
+    if cached is None:
+        data = dumps({'max_zoom': parser.max_zoom, 'max_index': parser.max_index, 'zoom_max_index': parser.zoom_max_index,
+                      'fnames': [[list(fzoom_group) for fzoom_group in ftransform_group] for ftransform_group in parser.fnames],
+                      'ftimes': [[list(tzoom_group) for tzoom_group in ttransform_group] for ttransform_group in parser.ftimes],
+                      'plot_url': _plot_url_bases(user, run)[2]},
+                     separators=(',', ':'))
+        compressor = compressobj(9, DEFLATED, MAX_WBITS | 16)  # | 16 for a gzip header
+        cached = (compressor.compress(data) + compressor.flush(), md5(data).hexdigest())
+        page_cache.put(key, *cached)
+
+    if request.accept_encodings['gzip']:
+        response = make_response(cached[0])
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(cached[1] + '-gzip')
+    else:
+        response = make_response(decompress(cached[0], MAX_WBITS | 16))
+        response.set_etag(cached[1])
+    response.mimetype = 'application/json'
+    response.vary.add('Accept-Encoding')
+    response.last_modified = datetime.utcfromtimestamp(int(parser.version[0]))
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route("/<string:user>/<string:run>/show_tiles/<int:zoom>/<int:index1>/<int:index2>")
+@_cached_page
 def show_tiles(user, run, zoom, index1, index2):
     """Tiled image viewer! Shows all of the plots produced from a pipeline run at different zooms 
     across varying time intervals. The range of pictures shown can be changed to any values in 
     the url (index1 is the index of the first image shown and index2 is the index of the last 
     and defaults are set to 0 and 4 for the link accessed from the home page). The numbers displayed
-    are the time in seconds at the start of the plot."""
+    are the time in seconds at the start of the plot. Adding ?mosaic=1 to the url shows all of the plots
+    as a single image (see mosaics.py), which is much quicker over slow connections."""
 
-    if run not in master_directories.pipeline_dir[str(user)]:
-        global master_directories
-        master_directories.pipeline_dir[user] = master_directories._update_user(user)
-    if run not in master_directories.pipeline_dir[str(user)]:
+    if not master_directories.has_run(user, run):
         return "The run was not found."
 
     fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
@@ -318,54 +1484,80 @@ def show_tiles(user, run, zoom, index1, index2):
             'by the bonsai plotter. This pipeline run cannot be displayed.'
         return s
 
-    display = '<h3>Displaying Plots %d-%d at Zoom %d</h3>' % (index1, index2, (max_zoom - zoom - 1))  # account for resversal of zoom order in plotter
-    display += '<table cellspacing="0" cellpadding="0">'
-
-    for transform in reversed(range(len(fnames))):    # reversed to show triggers first
-        display += '<tr>'
-        # First, add plot times 
-        for index in range(index1, index2 + 1):
-            if _check_image(user, run, transform, zoom, index):
-                display += '<td>%s</td>' % ftimes[transform][zoom][index]
-        display += '</tr>'
-        # Now, add the images
-        for index in range(index1, index2 + 1):
-            if _check_image(user, run, transform, zoom, index):
-                display += '<td><img src="%s"></td>' % url_for('static', filename='plots/%s/%s/%s' % (user, run, fnames[transform][zoom][index]))
-        display += '</tr><tr><td>&nbsp;</td></tr>'
-
-    # Links to user and user/run pages
-    display += '<p><center>[&nbsp;&nbsp;&nbsp;<a href="%s">Back to Users List</a>&nbsp;&nbsp;&nbsp;<a href="%s">Back to Your Runs</a>&nbsp;&nbsp;&nbsp;<a href="%s">' \
-               'Show Triggers</a>&nbsp;&nbsp;&nbsp;<a href="%s">Show Last Transform</a>&nbsp;&nbsp;&nbsp;]</center></p>' \
-               % (url_for('index'), url_for('runs', user=user), url_for('show_triggers', user=user, run=run, zoom=0), 
-                  url_for('show_last_transform', user=user, run=run, zoom=zoom))
+    can_mosaic = mosaics.available and (user, run) not in master_directories.remote_runs  # needs the plot files here
+    mosaic = request.args.get('mosaic') == '1' and can_mosaic
+    mode = {'mosaic': 1} if mosaic else {}  # so the navigation links stay in the same view
 
     # Plots to be linked
-    display += '<p> <center> [&nbsp;&nbsp;&nbsp;'
+    links = [(url_for('show_tiles', user=user, run=run, zoom=window[0], index1=window[1], index2=window[2], **mode)
+              if window is not None else None, label) for label, window in _tiles_links(user, run, zoom, index1, index2)]
+
+    variant_base = _plot_url_bases(user, run)[2]
 
+    def rows():
+        # (times, plot urls) for each transform, reversed to show triggers first. Some transforms have fewer plots 
+        # than others, so each one only gets the plots it has (the same ones _check_image() would allow).
+        for transform in reversed(range(len(fnames))):
+            if min_zoom <= zoom < max_zoom:
+                indices = range(max(index1, min_index), min(index2 + 1, max_index[transform][zoom]))
+            else:
+                indices = []
+            yield ([ftimes[transform][zoom][index] for index in indices],
+                   [variant_base + _quote_filename(fnames[transform][zoom][index]) for index in indices])
+
+    return _stream_template(_TILES_TEMPLATE, index1=index1, index2=index2,
+                            zoom_label=max_zoom - zoom - 1,  # account for resversal of zoom order in plotter
+                            mosaic_html=Markup(_mosaic_html(user, run, zoom, index1, index2)) if mosaic else None, 
+                            rows=rows(), index_url=url_for('index'), runs_url=url_for('runs', user=user),
+                            triggers_url=url_for('show_triggers', user=user, run=run, zoom=0),
+                            last_transform_url=url_for('show_last_transform', user=user, run=run, zoom=zoom),
+                            view_url=url_for('show_tiles', user=user, run=run, zoom=zoom, index1=index1, index2=index2,
+                                             **({} if mosaic else {'mosaic': 1})) if can_mosaic else None,
+                            view_label='Tile View' if mosaic else 'Mosaic View',
+                            viewer_url=url_for('viewer', user=user, run=run, zoom=zoom, index1=index1, index2=index2),
+                            links=links)
+
+# The Show Tiles page. The times go above each row of plots, and the links to the rest of the run below them.
+_TILES_TEMPLATE = app.jinja_env.from_string(
+    '<h3>Displaying Plots {{ index1 }}-{{ index2 }} at Zoom {{ zoom_label }}</h3>'
+    '{% if mosaic_html %}{{ mosaic_html }}{% else %}<table cellspacing="0" cellpadding="0">'
+    '{% for times, plots in rows %}'
+    '<tr>{% for time in times %}<td>{{ time }}</td>{% endfor %}</tr>'
+    '{% for plot in plots %}<td><img src="{{ plot }}"></td>{% endfor %}</tr><tr><td>&nbsp;</td></tr>'
+    '{% endfor %}{% endif %}'
+    '<p><center>[&nbsp;&nbsp;&nbsp;<a href="{{ index_url }}">Back to Users List</a>&nbsp;&nbsp;&nbsp;'
+    '<a href="{{ runs_url }}">Back to Your Runs</a>&nbsp;&nbsp;&nbsp;<a href="{{ triggers_url }}">Show Triggers</a>'
+    '&nbsp;&nbsp;&nbsp;<a href="{{ last_transform_url }}">Show Last Transform</a>&nbsp;&nbsp;&nbsp;]</center></p>'
+    '<p><center>[&nbsp;&nbsp;&nbsp;'
+    '{% if view_url %}<a href="{{ view_url }}">{{ view_label }}</a>&nbsp;&nbsp;&nbsp;{% endif %}'
+    '<a href="{{ viewer_url }}">Fast Viewer</a>&nbsp;&nbsp;&nbsp;]</center></p>'
+    '<p> <center> [&nbsp;&nbsp;&nbsp;'
+    '{% for url, label in links %}{% if url %}<a href="{{ url }}">{{ label }}</a>{% else %}{{ label }}{% endif %}'
+    '&nbsp;&nbsp;&nbsp;{% endfor %}]</p> </center>')
+
+def _tiles_links(user, run, zoom, index1, index2):
+    """The navigation links of a Show Tiles window: (label, (zoom, index1, index2) of the window it goes to, or None 
+    if there's nothing there) for Prev Time, Next Time, Jump Back, Jump Forward, Zoom In and Zoom Out."""
+    links = []
     if _check_set(user, run, zoom, index1 - 1):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom, index1=index1 - 1, index2=index2 - 1)), 'Prev Time')
+        links.append(('Prev Time', (zoom, index1 - 1, index2 - 1)))
     else:
-        display += 'Prev Time&nbsp;&nbsp;&nbsp;'
+        links.append(('Prev Time', None))
 
     if _check_set(user, run, zoom, index1 + 1):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom, index1=index1 + 1, index2=index2 + 1)), 'Next Time')
+        links.append(('Next Time', (zoom, index1 + 1, index2 + 1)))
     else:
-        display += 'Next Time&nbsp;&nbsp;&nbsp;'
+        links.append(('Next Time', None))
 
     if _check_set(user, run, zoom, index1 - (index2 - index1)):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom, index1=index1 - (index2 - index1), index2=index2 - (index2 - index1))), 'Jump Back')
+        links.append(('Jump Back', (zoom, index1 - (index2 - index1), index2 - (index2 - index1))))
     else:
-        display += 'Jump Back&nbsp;&nbsp;&nbsp;'
+        links.append(('Jump Back', None))
 
     if _check_set(user, run, zoom, index1 + (index2 - index1)):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom, index1=index1 + (index2 - index1), index2=index2 + (index2 - index1))), 'Jump Forward')
+        links.append(('Jump Forward', (zoom, index1 + (index2 - index1), index2 + (index2 - index1))))
     else:
-        display += 'Jump Forward&nbsp;&nbsp;&nbsp;'
+        links.append(('Jump Forward', None))
 
     # For making the zooming preserve column number
     if (index2 - index1) % 2 == 0:
@@ -376,10 +1568,9 @@ def show_tiles(user, run, zoom, index1, index2):
         new_index2 = index2 * 2 - ceil(index2 - index1) / 2 + 1
 
     if _check_set(user, run, zoom + 1, index1 * 2):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom + 1, index1=int(new_index1), index2=int(new_index2))), 'Zoom In')
+        links.append(('Zoom In', (zoom + 1, int(new_index1), int(new_index2))))
     else:
-        display += 'Zoom In&nbsp;&nbsp;&nbsp;'
+        links.append(('Zoom In', None))
 
     # More column preservation
     if (index2 - index1) % 2 == 0:
@@ -390,66 +1581,149 @@ def show_tiles(user, run, zoom, index1, index2):
         new_index2 = (index2 + (ceil((index2 - index1) / 2) + 1)) / 2
 
     if _check_set(user, run, zoom - 1, index1 // 2):
-        display += '<a href="%s">%s</a>&nbsp;&nbsp;&nbsp;' % ((url_for('show_tiles',
-                    user=user, run=run, zoom=zoom - 1, index1=int(new_index1), index2=int(new_index2))), 'Zoom Out')
+        links.append(('Zoom Out', (zoom - 1, int(new_index1), int(new_index2))))
     else:
-        display += 'Zoom Out&nbsp;&nbsp;&nbsp;'
-    display += ']</p> </center>'
-    return display
+        links.append(('Zoom Out', None))
+    return links
+
+@app.route("/<string:user>/<string:prefix>/compare/<int:zoom>/<int:index1>/<int:index2>")
+def compare(user, prefix, zoom, index1, index2):
+    """Shows the runs with the same prefix side by side (all of them, or just the ones given with ?run=...&run=...), 
+    with their plots lined up by start time rather than by index: each column is a time slot, and each row is one 
+    transform of one run, with a gap wherever that run has no plot. The transforms are given with 
+    ?transform=...&transform=... (negative ones count back from the last, like -1 for the triggers, which is the 
+    default). index1 and index2 are the first and last time slots shown. The time slots are worked out once for 
+    the runs (see compare.py) and kept until one of them changes, so paging through long runs stays quick."""
+    runs, rows, alignment, version = _get_alignment(user, prefix, zoom)
+    if not rows:
+        return 'There are no runs with plots at this zoom to compare.'
+    key = ('compare', user, prefix, zoom, index1, index2, tuple(sorted(request.args.items(multi=True))), version)
+    cached = page_cache.get(key)
+    if cached is None:
+        data = _compare_page(user, prefix, zoom, index1, index2, runs, rows, alignment).encode('utf-8')
+        cached = (data, md5(data).hexdigest())
+        page_cache.put(key, *cached)
+    response = make_response(cached[0])
+    response.set_etag(cached[1])
+    response.cache_control.no_cache = True  # the runs may still change, so browsers should always check
+    return response.make_conditional(request)
+
+@app.route("/<string:user>/<string:prefix>/compare/at/<string:time>/<int:zoom>")
+def compare_at(user, prefix, zoom, time):
+    """Jumps to the comparison page with the time slot covering an absolute time in the middle, like at() does for 
+    a single run (the runs and transforms are passed on). The number of slots across can be changed with 
+    ?columns=..."""
+    try:
+        time = float(time)
+    except ValueError:
+        abort(404)
+    runs, rows, alignment, version = _get_alignment(user, prefix, zoom)
+    if not rows:
+        return 'There are no runs with plots at this zoom to compare.'
+    columns = max(request.args.get('columns', COMPARE_COLUMNS, type=int), 1)
+    index1 = max(alignment.find_slot(time) - columns // 2, 0)
+    return redirect(url_for('compare', user=user, prefix=prefix, zoom=zoom, index1=index1, index2=index1 + columns - 1,
+                            **_compare_args()))
+
+def _get_alignment(user, prefix, zoom):
+    """Returns (runs, rows, alignment, version) for the comparison pages: runs is [(run, Parser), ...] for the 
+    runs that can be shown, rows is [(run, transform), ...] (each transform of each run, if it has plots at 
+    zoom), alignment is the RunAlignment lining up the rows' plots, and version identifies the runs' versions."""
+    chosen = request.args.getlist('run')
+    runs = []
+    for run in sorted(master_directories.pipeline_dir.get(user, {})):
+        if run_prefix(run) == prefix and (not chosen or run in chosen):
+            parser = master_directories.get_run(user, run)
+            if parser is not None and parser.max_index is not None:
+                runs.append((run, parser))
+    rows = []
+    groups = []
+    for transform in request.args.getlist('transform', type=int) or [-1]:
+        for run, parser in runs:
+            if -len(parser.fnames) <= transform < len(parser.fnames) and 0 <= zoom < parser.max_zoom:
+                rows.append((run, transform % len(parser.fnames)))
+                groups.append((parser.table, transform % len(parser.fnames), zoom))
+    version = tuple((run, parser.version) for run, parser in runs)
+    alignment = alignments.get((user, zoom, tuple(rows), version), groups) if rows else None
+    return runs, rows, alignment, version
+
+def _compare_args():
+    # The runs and transforms of the comparison page, for its links to the others
+    return dict((name, request.args.getlist(name)) for name in ('run', 'transform') if name in request.args)
+
+def _compare_page(user, prefix, zoom, index1, index2, runs, rows, alignment):
+    """Renders one window of the comparison page."""
+    parsers = dict(runs)
+    variant_bases = dict((run, _plot_url_bases(user, run)[2]) for run, parser in runs)
+    slots = range(index1, min(index2 + 1, len(alignment)))
+    table = []
+    for group, (run, transform) in enumerate(rows):
+        fnames = parsers[run].fnames[transform][zoom]
+        cells = []
+        for slot in slots:
+            index = int(alignment.indices[group][slot])
+            if index < 0:
+                cells.append(None)
+            else:
+                cells.append((_at_url(user, run, zoom, index, AT_COLUMNS), 
+                              variant_bases[run] + _quote_filename(fnames[index])))
+        table.append(('%s (transform %d)' % (run[-17:], transform), 
+                      url_for('show_tiles', user=user, run=run, zoom=zoom, index1=0, index2=3), cells))
+
+    args = _compare_args()
+    width = index2 - index1 + 1
+    max_zoom = max(parser.max_zoom for run, parser in runs)
+    links = []
+    links.append((url_for('compare', user=user, prefix=prefix, zoom=zoom, index1=max(index1 - width, 0), 
+                          index2=max(index1 - width, 0) + width - 1, **args) if index1 > 0 else None, 'Jump Back'))
+    links.append((url_for('compare', user=user, prefix=prefix, zoom=zoom, index1=index1 + width, index2=index2 + width, 
+                          **args) if index2 + 1 < len(alignment) else None, 'Jump Forward'))
+    middle_time = repr(float(alignment.times[min((index1 + index2) // 2, len(alignment) - 1)]))
+    links.append((url_for('compare_at', user=user, prefix=prefix, time=middle_time, zoom=zoom + 1, columns=width, **args)
+                  if zoom + 1 < max_zoom else None, 'Zoom In'))
+    links.append((url_for('compare_at', user=user, prefix=prefix, time=middle_time, zoom=zoom - 1, columns=width, **args)
+                  if zoom > 0 else None, 'Zoom Out'))
+
+    return _COMPARE_TEMPLATE.render(prefix=prefix, index1=index1, index2=index2, nslots=len(alignment),
+                                    zoom_label=max_zoom - zoom - 1, times=[float(alignment.times[slot]) for slot in slots],
+                                    rows=table, links=links, index_url=url_for('index'), runs_url=url_for('runs', user=user))
+
+# The comparison page. Each row is labelled with its run and transform (linking to the run's Show Tiles page), and each
+# plot links to the Show Tiles page around it.
+_COMPARE_TEMPLATE = app.jinja_env.from_string(
+    '<h3>Comparing {{ prefix }}: Time Slots {{ index1 }}-{{ index2 }} of {{ nslots }} at Zoom {{ zoom_label }}</h3>'
+    '<table cellspacing="0" cellpadding="0">'
+    '<tr><td></td>{% for time in times %}<td>{{ time }}</td>{% endfor %}</tr>'
+    '{% for label, tiles_url, cells in rows %}'
+    '<tr><td><a href="{{ tiles_url }}">{{ label }}</a>&nbsp;</td>'
+    '{% for cell in cells %}<td>{% if cell %}<a href="{{ cell[0] }}"><img src="{{ cell[1] }}"></a>{% endif %}</td>'
+    '{% endfor %}</tr>{% endfor %}</table>'
+    '<p><center>[&nbsp;&nbsp;&nbsp;<a href="{{ index_url }}">Back to Users List</a>&nbsp;&nbsp;&nbsp;'
+    '<a href="{{ runs_url }}">Back to Your Runs</a>&nbsp;&nbsp;&nbsp;]</center></p>'
+    '<p> <center> [&nbsp;&nbsp;&nbsp;'
+    '{% for url, label in links %}{% if url %}<a href="{{ url }}">{{ label }}</a>{% else %}{{ label }}{% endif %}'
+    '&nbsp;&nbsp;&nbsp;{% endfor %}]</p> </center>')
 
 @app.route("/<string:user>/<string:run>/show_last_transform/<int:zoom>")
+@_cached_page
 def show_last_transform(user, run, zoom):
     """Displays the plots for the last transform at a given zoom horizontally. The zoom level can be changed by 
     changing the value in the url. Currently just indexes the second last value in fnames."""
-
-    if run not in master_directories.pipeline_dir[str(user)]:
-        global master_directories
-        master_directories.pipeline_dir[user] = master_directories._update_user(user)
-    if run not in master_directories.pipeline_dir[str(user)]:
-        return "The run was not found."
-
-    fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
-
-    if fnames is None:
-        return 'No files found.'
-
-    if max_index is None:
-        s = 'The number of zoom levels produced by the pipeline plotter was unequal to the number of plots produced ' \
-            'by the bonsai plotter. This pipeline run cannot be displayed.'
-        return s
-
-    triggerList = fnames[-2]
-    display = '<h3>Displaying Last Transform Plots at Zoom %s</h3>' % (max_zoom - zoom - 1)
-    display += '<p><center>[&nbsp;&nbsp;&nbsp;<a href="%s">Back to Users List</a>&nbsp;&nbsp;&nbsp;<a href="%s">Back to Your Runs</a>' \
-               '&nbsp;&nbsp;&nbsp;]</center></p>' % (url_for('index'), url_for('runs', user=user))
-    display += '<table cellspacing="0" cellpadding="0"><tr>'
-
-    last_row = 0
-    current_row = 0
-
-    for i, trigger in enumerate(triggerList[zoom]):
-        temp = url_for('static', filename='plots/%s/%s/%s' % (user, run, trigger))
-        if i > 1 and i < max_index[-1][zoom] - 2:
-            temp_link = url_for('show_tiles', user=user, run=run, zoom=zoom, index1=i - 2, index2=i + 1)
-            display += '<td><a href="%s"><img src="%s"></a></td>' % (temp_link, temp)
-        else:
-            display += '<td><img src="%s"></td>' % temp
-        current_row += 1
-        if (current_row - last_row) == 5:
-            last_row = current_row
-            display += '</tr><tr><td>&nbsp;</td></tr><tr>'
-    display += '</tr></table>'
-    return display
+    return _show_overview(user, run, zoom, -2, 'Last Transform')
 
 @app.route("/<string:user>/<string:run>/show_triggers/<int:zoom>")
+@_cached_page
 def show_triggers(user, run, zoom):
     """Displays all trigger plots at a given zoom horizontally. The zoom level can be changed by changing the value in the url. 
     Currently just indexes the last value in fnames."""
+    return _show_overview(user, run, zoom, -1, 'Trigger')
+
+def _show_overview(user, run, zoom, transform, title):
+    """The Show Triggers and Show Last Transform pages. Only the first OVERVIEW_PAGE_PLOTS plots are sent with the 
+    page - the rest are fetched from plots_api() as the page is scrolled down (or all sent at once with ?all=1, 
+    for browsers without javascript)."""
 
-    if run not in master_directories.pipeline_dir[str(user)]:
-        global master_directories
-        master_directories.pipeline_dir[user] = master_directories._update_user(user)
-    if run not in master_directories.pipeline_dir[str(user)]:
+    if not master_directories.has_run(user, run):
         return "The run was not found."
 
     fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
@@ -464,28 +1738,156 @@ def show_triggers(user, run, zoom):
 
     zoom = int(zoom)
 
-    triggerList = fnames[-1]
-    display = '<h3>Displaying Trigger Plots at Zoom %s</h3>' % (max_zoom - zoom - 1)
-    display += '<p><center>[&nbsp;&nbsp;&nbsp;<a href="%s">Back to Users List</a>&nbsp;&nbsp;&nbsp;<a href="%s">Back to Your Runs</a>' \
-               '&nbsp;&nbsp;&nbsp;]</center></p>' % (url_for('index'), url_for('runs', user=user))
-    display += '<table cellspacing="0" cellpadding="0"><tr>'
-
-    last_row = 0
-    current_row = 0
-
-    for i, trigger in enumerate(triggerList[zoom]):
-        temp = url_for('static', filename='plots/%s/%s/%s' % (user, run, trigger))
-        if i > 1 and i < max_index[-1][zoom] - 2:
-            temp_link = url_for('show_tiles', user=user, run=run, zoom=zoom, index1=i - 2, index2=i + 1)
-            display += '<td><a href="%s"><img src="%s"></a></td>' % (temp_link, temp)
-        else:
-            display += '<td><img src="%s"></td>' % temp
-        current_row += 1
-        if (current_row - last_row) == 5:
-            last_row = current_row
-            display += '</tr><tr><td>&nbsp;</td></tr><tr>'
-    display += '</tr></table>'
-    return display
+    triggerList = fnames[transform]
+    nplots = len(triggerList[zoom])
+    first_plots = nplots if request.args.get('all') == '1' else min(nplots, OVERVIEW_PAGE_PLOTS)
+    plot_base, image_base = _plot_url_bases(user, run)[:2]
+    tiles_base = _tiles_url_base(user, run)
+
+    def plots():
+        # (link, image url) for each plot on the page
+        for i, trigger in enumerate(triggerList[zoom][:first_plots]):
+            trigger = _quote_filename(trigger)
+            yield _overview_link(tiles_base, zoom, i, max_index) or plot_base + trigger, image_base + trigger
+
+    return _stream_template(_OVERVIEW_TEMPLATE, title=title, zoom_label=max_zoom - zoom - 1, 
+                            index_url=url_for('index'), runs_url=url_for('runs', user=user),
+                            api_url=url_for('plots_api', user=user, run=run, transform=transform, zoom=zoom),
+                            first_plots=first_plots, nplots=nplots, plots=plots(),
+                            all_url=url_for(request.endpoint, user=user, run=run, zoom=zoom, all=1),
+                            script=Markup(_OVERVIEW_SCRIPT % OVERVIEW_PAGE_PLOTS))
+
+def _overview_link(tiles_base, zoom, i, max_index):
+    # Plots on the overview pages link to the Show Tiles page around them (if there are enough plots on either side)
+    window = _overview_window(zoom, i, max_index)
+    if window is not None:
+        return '%s%d/%d/%d' % ((tiles_base,) + window)
+    return None
+
+def _overview_window(zoom, i, max_index):
+    # The (zoom, index1, index2) of the Show Tiles window an overview page's plot links to, or None
+    if i > 1 and i < max_index[-1][zoom] - 2:
+        return zoom, i - 2, i + 1
+    return None
+
+# The Show Triggers and Show Last Transform pages, with the plots five to a row
+_OVERVIEW_TEMPLATE = app.jinja_env.from_string(
+    '<h3>Displaying {{ title }} Plots at Zoom {{ zoom_label }}</h3>'
+    '<p><center>[&nbsp;&nbsp;&nbsp;<a href="{{ index_url }}">Back to Users List</a>&nbsp;&nbsp;&nbsp;'
+    '<a href="{{ runs_url }}">Back to Your Runs</a>&nbsp;&nbsp;&nbsp;]</center></p>'
+    '<table id="plots" cellspacing="0" cellpadding="0" data-url="{{ api_url }}" data-offset="{{ first_plots }}" '
+    'data-total="{{ nplots }}"><tr>'
+    '{% for link, image in plots %}<td><a href="{{ link }}"><img src="{{ image }}"></a></td>'
+    '{% if loop.index is divisibleby 5 %}</tr><tr><td>&nbsp;</td></tr><tr>{% endif %}{% endfor %}'
+    '</tr></table>'
+    '{% if first_plots < nplots %}'
+    '<noscript><p><a href="{{ all_url }}">Show all {{ nplots }} plots</a></p></noscript>{{ script }}'
+    '{% endif %}')
+
+# Loads the rest of the plots on an overview page from plots_api() as it's scrolled down, adding 
+# them to the table five to a row, just like the ones sent with the page
+_OVERVIEW_SCRIPT = """<script>
+(function() {
+    var table = document.getElementById('plots');
+    var url = table.getAttribute('data-url');
+    var offset = parseInt(table.getAttribute('data-offset'));
+    var total = parseInt(table.getAttribute('data-total'));
+    var loading = false;
+    var failures = 0;
+    var error = null;
+
+    function lastRow() {
+        return table.rows[table.rows.length - 1];
+    }
+
+    function addPlot(plot) {
+        if (lastRow().cells.length == 5) {
+            table.insertRow(-1).insertCell(-1).innerHTML = '&nbsp;';
+            table.insertRow(-1);
+        }
+        var link = document.createElement('a');
+        var image = document.createElement('img');
+        link.href = plot.tiles || plot.plot;
+        image.src = plot.image;
+        link.appendChild(image);
+        lastRow().insertCell(-1).appendChild(link);
+    }
+
+    function loadMore() {
+        // Keep about a screen's worth of plots below the bottom of the window
+        if (loading || offset >= total || table.getBoundingClientRect().bottom > 2 * window.innerHeight)
+            return;
+        loading = true;
+        var request = new XMLHttpRequest();
+        request.open('GET', url + '?offset=' + offset + '&limit=%d');
+        request.onload = function() {
+            if (request.status != 200)
+                return failed();
+            var page = JSON.parse(request.responseText);
+            page.plots.forEach(addPlot);
+            offset += page.plots.length;
+            loading = false;
+            failures = 0;
+            if (error != null) {
+                error.parentNode.removeChild(error);
+                error = null;
+            }
+            if (page.plots.length > 0)
+                loadMore();
+        };
+        request.onerror = failed;
+        request.send();
+    }
+
+    function failed() {
+        // E.g. a 503 while the run is being parsed again - try a few more times, a little later each time, and 
+        // then say so (scrolling tries again after that)
+        loading = false;
+        failures++;
+        if (failures < 5) {
+            setTimeout(loadMore, 1000 * failures);
+        } else if (error == null) {
+            error = document.createElement('p');
+            error.innerHTML = 'The rest of the plots could not be loaded. Scroll down to try again.';
+            table.parentNode.insertBefore(error, table.nextSibling);
+        }
+    }
+
+    window.addEventListener('scroll', loadMore);
+    window.addEventListener('resize', loadMore);
+    loadMore();
+})();
+</script>"""
+
+@app.route("/api/<string:user>/<string:run>/plots/<int(signed=True):transform>/<int:zoom>")
+def plots_api(user, run, transform, zoom):
+    """Returns a slice of the plots for one transform (negative numbers count from the end, like fnames) at one 
+    zoom as json: {"total": ..., "offset": ..., "plots": [{"index", "filename", "time", "plot", "image", "tiles"}, ...]}
+    where plot is the url of the full size plot, image is the url to show it with on the overview pages (a thumbnail, 
+    if we can make them) and tiles is the Show Tiles page around it (or null). The slice is given by ?offset=...&limit=...
+    (at most API_MAX_PLOTS)."""
+    if not master_directories.has_run(user, run):
+        abort(404)
+    fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
+    if max_index is None or not -len(fnames) <= transform < len(fnames) or not 0 <= zoom < max_zoom:
+        abort(404)
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', OVERVIEW_PAGE_PLOTS, type=int), 0), API_MAX_PLOTS)
+    names = fnames[transform][zoom]
+    times = ftimes[transform][zoom]
+    plot_base, image_base = _plot_url_bases(user, run)[:2]
+    tiles_base = _tiles_url_base(user, run)
+    plots = []
+    for i in range(offset, min(offset + limit, len(names))):
+        quoted_name = _quote_filename(names[i])
+        plots.append({'index': i, 'filename': names[i], 'time': times[i], 'plot': plot_base + quoted_name,
+                      'image': image_base + quoted_name, 'tiles': _overview_link(tiles_base, zoom, i, max_index)})
+
+    response = jsonify(total=len(names), offset=offset, plots=plots)
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 def _check_set(user, run, zoom, index):
     """Checks whether a link should be added at the top of the page to the next set of images in the series."""
@@ -496,18 +1898,202 @@ def _check_set(user, run, zoom, index):
     # one transform happened to output more than the rest). This means
     # we need to check again when we are displaying each individual
     # image whether it exists.
-    fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
-    if zoom >= max_zoom or zoom < min_zoom or index < min_index or index >= max([element[zoom] for element in max_index]):
+    parser = master_directories.get_run(user, run, validate=False)
+    if zoom >= parser.max_zoom or zoom < parser.min_zoom or index < parser.min_index or \
+            index >= parser.zoom_max_index[zoom]:
         return False
     return True
 
 def _check_image(user, run, transform, zoom, index):
     """Checks whether a particular image is available (because some transforms seem to produce more plots than others)"""
-    fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run)
+    fnames, ftimes, min_zoom, min_index, max_zoom, max_index = _get_run_info(user, run, validate=False)
     if zoom >= max_zoom or zoom < min_zoom or index < min_index or index >= max_index[transform][zoom]:
         return False
     return True
 
 
-master_directories = Crawler()     # dirs contains a dictionary in the form {'user1': {'run1': Parser1, 'run2': Parser2, ...}, ...}
+def export_runs(user_runs, workers=CRAWL_WORKERS, processes=CRAWL_PROCESSES, force=False):
+    """Exports the pages of a list of (user, run)s to static HTML (see export_run()), along with the runs pages of 
+    their users. The runs are exported in parallel, by a pool of processes if processes > 0 (the pages are mostly 
+    rendered in Python, so threads only really help while waiting on the filesystem) or else by workers threads. 
+    A run that can't be exported is skipped (and its error kept in master_directories.errors). Returns the number 
+    of pages written."""
+    pool = Pool(processes) if processes > 0 else ThreadPool(max(workers, 1))
+    try:
+        results = pool.map(_export_one, [(user, run, force) for user, run in user_runs], chunksize=1)
+    finally:
+        pool.close()
+    for (user, run), (npages, error) in zip(user_runs, results):
+        if error is not None:
+            master_directories.errors[(user, run)] = error
+    users = sorted(set(user for user, run in user_runs))
+    for user in users:
+        atomic_write('%s/%s/%s/runs.html' % (master_directories.path, user, EXPORT_DIR), _render_page('runs', user=user))
+    return sum(npages for npages, error in results) + len(users)
+
+def _export_one(args):
+    # Exports a run for export_runs() (in a pool, so errors are returned rather than raised)
+    user, run, force = args
+    try:
+        return export_run(user, run, force), None
+    except Exception as e:
+        return 0, repr(e)
+
+def export_run(user, run, force=False):
+    """Writes the pages of a run to EXPORT_DIR inside its directory, so that a plain web server can send them: 
+    every Show Tiles window that the runs page, the overview pages or the navigation links of another exported 
+    window lead to, and the Show Triggers and Show Last Transform pages at every zoom, with all of their plots 
+    (rather than loading them from plots_api() as they're scrolled down). The images on the exported pages are 
+    the plot files themselves, and thumbnails written to EXPORT_DIR/thumbnails for the overview pages. The run's 
+    json version is saved with them, and the run is skipped next time unless it has changed (or force is True). 
+    Files left over from an older version of the run are removed. Returns the number of pages written."""
+    if (user, run) in master_directories.remote_runs:
+        return 0  # exported on its own machine, if at all
+    run_path = master_directories.pipeline_dir[user][run]
+    # Parse the run here, rather than leaving it to the pages (which only wait RUN_LOAD_TIMEOUT for it)
+    parser = master_directories.runs.get(user, run, run_path, read_files=_read_files)
+    if parser.fnames is None or parser.max_index is None:
+        return 0  # the viewer can't show it either
+    export_path = '%s/%s' % (run_path, EXPORT_DIR)
+    version_path = join(export_path, 'version.json')
+    version = dumps(list(parser.version))
+    if not force and exists(version_path):
+        with open(version_path) as f:
+            if f.read() == version:
+                return 0
+
+    # The Show Tiles windows linked to from the runs page and the overview pages, and then every window those 
+    # link to in turn (zooming in and out doesn't always keep the same number of columns)
+    windows = set()
+    todo = [(0, 0, 3)]
+    for zoom in range(parser.min_zoom, parser.max_zoom):
+        todo.extend(_overview_window(zoom, i, parser.max_index) for i in range(len(parser.fnames[-1][zoom])))
+    while todo:
+        window = todo.pop()
+        if window is None or window in windows or window[1] < 0 or window[2] < 0:
+            continue  # no link, already done, or a link the viewer itself would answer with a 404
+        windows.add(window)
+        todo.extend(link_window for label, link_window in _tiles_links(user, run, *window))
+
+    pages = dict()  # {file name under export_path: (endpoint, url values)}
+    for zoom, index1, index2 in windows:
+        pages['show_tiles/%d/%d/%d.html' % (zoom, index1, index2)] = \
+            ('show_tiles', dict(zoom=zoom, index1=index1, index2=index2))
+    for zoom in range(parser.min_zoom, parser.max_zoom):
+        for endpoint in ('show_triggers', 'show_last_transform'):
+            pages['%s/%d.html' % (endpoint, zoom)] = (endpoint, dict(zoom=zoom, all=1))
+
+    files = set(pages)  # everything that should be left in export_path (apart from the version)
+    if thumbnails.available:
+        for transform in (-1, -2):  # the overview pages' plots
+            for zoom in range(parser.min_zoom, parser.max_zoom):
+                for filename in parser.fnames[transform][zoom]:
+                    thumb_name = 'thumbnails/' + filename
+                    if thumb_name not in files:
+                        files.add(thumb_name)
+                        _export_thumbnail(join(run_path, filename), join(export_path, thumb_name))
+    for name, (endpoint, values) in sorted(pages.items()):
+        atomic_write(join(export_path, name), _render_page(endpoint, user=user, run=run, **values))
+
+    for dir_path, dir_names, file_names in walk(export_path):
+        for file_name in file_names:
+            file_path = join(dir_path, file_name)
+            if file_path != version_path and file_path[len(export_path) + 1:] not in files:
+                remove(file_path)
+    atomic_write(version_path, version)  # last, so a run that was only half exported is done again
+    return len(pages)
+
+def _export_thumbnail(plot_path, thumb_path):
+    # (Re)makes an exported thumbnail if it's missing or older than its plot. These aren't in the ThumbnailCache, 
+    # since the exported pages need them to stay where they are.
+    if exists(thumb_path):
+        if stat(thumb_path).st_mtime >= stat(plot_path).st_mtime:
+            return
+        remove(thumb_path)
+    make_thumbnail(plot_path, thumb_path, THUMBNAIL_WIDTH)
+
+def _render_page(endpoint, **values):
+    # Renders a page just like it's sent to browsers (but without the request hooks, which are for real requests), 
+    # except that it points at the files a static web server can send (see _plot_url_bases())
+    with app.test_request_context(_export_url(endpoint, **values)):
+        g.export = True
+        response = app.make_response(app.dispatch_request())
+        if response.status_code != 200:
+            raise RuntimeError('%s returned %d' % (request.path, response.status_code))
+        return response.get_data()
+
+def _export_url(endpoint, **values):
+    # url_for() outside of a request
+    with app.test_request_context():
+        return url_for(endpoint, **values)
+
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL)  # for /metrics, see prometheus_metrics()
+metrics.histogram('web_viewer_request_duration_seconds', 'Time taken to answer requests (until the last byte was sent).',
+                  (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+metrics.counter('web_viewer_requests_total', 'Requests answered, by endpoint and status.')
+metrics.histogram('web_viewer_response_size_bytes', 'Size of the responses sent.', (1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+metrics.histogram('web_viewer_parse_seconds', 'Time taken to read the file names and times out of a rf_pipeline_0.json.',
+                  (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+metrics.counter('web_viewer_user_rescans_total', 'User directories scanned for runs by the Crawler.')
+metrics.counter('web_viewer_run_updates_total', 'Runs added or reloaded one at a time (by the RunWatcher or a page).')
+metrics.counter('web_viewer_stale_runs_served_total', 'Runs served as they were while their new version was parsed.')
+metrics.counter('web_viewer_listing_rescans_total', 'Directories listed again for the users and runs pages.')
+metrics.counter('web_viewer_cache_lookups_total', 'Lookups in the run, page, thumbnail, variant and alignment caches.')
+metrics.counter('web_viewer_cache_hits_total', 'Lookups in the run, page, thumbnail, variant and alignment caches that found what they wanted.')
+metrics.counter('web_viewer_variant_fallbacks_total', 'Plots sent as they are because their variant was not ready (or could not be made).')
+metrics.counter('web_viewer_snapshot_hits_total', 'Runs read from the shared snapshot rather than parsed or read from the index.')
+metrics.counter('web_viewer_remote_requests_total', 'Requests sent to the viewers on other machines.')
+metrics.counter('web_viewer_remote_connections_total', 'Connections opened to the viewers on other machines (the rest were kept alive).')
+metrics.gauge('web_viewer_runs_in_memory', 'Parsed runs held in memory.')
+metrics.gauge('web_viewer_plots_in_memory', 'Plots in the parsed runs held in memory.')
+metrics.gauge('web_viewer_run_cache_bytes', 'Rough memory used by the parsed runs.')
+metrics.gauge('web_viewer_page_cache_bytes', 'Memory used by the cached pages.')
+metrics.add_collector(_collect_metrics)
+remote = RemoteNodes(REMOTE_NODES, REMOTE_CACHE_PATH, REMOTE_INDEX_TTL, REMOTE_TIMEOUT, REMOTE_CONNECTIONS) \
+    if REMOTE_NODES else None  # runs on other machines, see remote.py
+master_directories = Crawler(remote=remote, snapshot=_load_snapshot(SNAPSHOT_PATH))     # dirs contains a dictionary in the form {'user1': {'run1': path1, 'run2': path2, ...}, ...}
 path = 'static/plots'  # where we will search for users/runs/plots
+watcher = None  # RunWatcher for this process, started by _start_watcher()
+page_cache = PageCache()  # rendered pages, see _cached_page()
+listing = DirectoryListing(path, LISTING_TTL)  # users and runs for index() and runs()
+thumbnails = ThumbnailCache(THUMBNAIL_WIDTH, THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_WORKERS)
+mosaics = MosaicCache(MOSAIC_CACHE_MAX_BYTES)
+variants = VariantCache(VARIANT_CACHE_DIR, VARIANT_CACHE_MAX_BYTES, VARIANT_PROCESSES)
+alignments = AlignmentCache(ALIGNMENT_CACHE_MAX_BYTES)  # time slots of the compared runs, see compare()
+app.config['USE_X_SENDFILE'] = PLOT_SENDFILE_MODE == 'x-sendfile'
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from time import time
+    arg_parser = ArgumentParser(description='Parses every pipeline run into the run index (see Crawler.warm()) or '
+                                            'the shared snapshot (see Crawler.write_snapshot()), or exports runs to '
+                                            'static HTML (see export_runs()).')
+    arg_parser.add_argument('--warm', action='store_true', help='parse every run that is not in the index yet')
+    arg_parser.add_argument('--export', nargs='+', metavar=('USER', 'RUN'), 
+                            help="export a user's runs (or just the runs given) to static HTML")
+    arg_parser.add_argument('--snapshot', action='store_true', help='write every run to the shared snapshot')
+    arg_parser.add_argument('--force', action='store_true', help='export runs even if they have not changed')
+    arg_parser.add_argument('--workers', type=int, default=CRAWL_WORKERS, help='threads reading (or exporting) runs')
+    arg_parser.add_argument('--processes', type=int, default=CRAWL_PROCESSES, help='processes parsing json files (or exporting runs)')
+    args = arg_parser.parse_args()
+    if args.warm:
+        start = time()
+        nruns = master_directories.warm(args.workers, args.processes)
+        print('Read %d runs in %.1f s' % (nruns, time() - start))
+    if args.snapshot:
+        start = time()
+        nruns = master_directories.write_snapshot(SNAPSHOT_PATH, args.workers, args.processes)
+        print('Wrote %d runs to %s in %.1f s' % (nruns, SNAPSHOT_PATH, time() - start))
+    if args.export:
+        start = time()
+        user = args.export[0]
+        export_user_runs = args.export[1:] or sorted(master_directories.pipeline_dir.get(user, {}))
+        missing = [run for run in export_user_runs if run not in master_directories.pipeline_dir.get(user, {})]
+        if missing:
+            arg_parser.error('no such run(s): %s' % ', '.join('%s/%s' % (user, run) for run in missing))
+        npages = export_runs([(user, run) for run in export_user_runs], args.workers, args.processes, args.force)
+        print('Exported %d pages from %d runs in %.1f s' % (npages, len(export_user_runs), time() - start))
+    for (user, run), error in sorted(master_directories.errors.items()):
+        print('Skipped %s/%s: %s' % (user, run, error))